@@ -1,8 +1,42 @@
+"""Constraints and attributed variables.
+
+A constraint restricts the values a term may take. Unifying a constraint with a value checks the value, and
+unifying two constraints combines them.
+
+Unifying a constraint with an unbound variable attaches the constraint to the variable as an attribute. Attributes
+live in a ConstraintStore, which wraps a substitution and is used in its place:
+
+    s = ConstraintStore()
+    s = unify(x, Positive(), s)
+    s = unify(x, 5, s)  # checks Positive against 5
+
+When variables are bound, only the constraints attached to those variables are checked again. A variable that
+is bound to another unbound variable passes its constraint on to it, combined with the constraint the other
+variable already has. Stores are created on demand if a constraint meets a variable in a plain substitution.
+"""
+
 from abc import ABC, abstractmethod
-from core import occurs_dispatch, unify_dispatch, extend_substitution, Term, Mismatch
-from variable import Var
+from collections.abc import Mapping
+import typing
 from typing import Any, Optional
 
+from core import (
+    Failure,
+    Mismatch,
+    Substitution,
+    Term,
+    compact_dispatch,
+    extend_dispatch,
+    find_keys,
+    match_dispatch,
+    occurs_dispatch,
+    unify_dispatch,
+    update_base_dispatch,
+    update_dispatch,
+    walk,
+)
+from hamt import Hamt
+from variable import Var
 
 # For now, assume constraints can't contain variables.
 # We can say things like >0 or >10 & <20, but not <X.
@@ -18,28 +52,145 @@ class Constraint(ABC):
         pass
 
 
+class ConstraintStore(Mapping):
+    """Substitution together with the constraints attached to its unbound variables.
+
+    Lookups are answered by the wrapped substitution, so the store can be used wherever a substitution is.
+    """
+
+    __slots__ = ("substitution", "attributes")
+
+    def __init__(self, substitution: Substitution = None, attributes: Hamt = None):
+        self.substitution = Hamt() if substitution is None else substitution
+        self.attributes = Hamt() if attributes is None else attributes
+
+    def constraint(self, x: Var) -> Optional[Constraint]:
+        """Return the constraint attached to x, or None."""
+        v = walk(x, self.substitution)
+        # terms that x is bound to have no constraint, and may be expensive to hash
+        return self.attributes.get(v) if isinstance(v, Var) else None
+
+    def get(self, key, default=None):
+        return self.substitution.get(key, default)
+
+    def __getitem__(self, key):
+        return self.substitution[key]
+
+    def __contains__(self, key):
+        return key in self.substitution
+
+    def __iter__(self):
+        return iter(self.substitution)
+
+    def __len__(self):
+        return len(self.substitution)
+
+    def __repr__(self):
+        return (
+            f"ConstraintStore({self.substitution!r}, {dict(self.attributes.items())!r})"
+        )
+
+
+def attach(
+    x: Var, c: Constraint, s: Substitution
+) -> typing.Union[Substitution, Failure]:
+    """Attach c to the unbound variable x, combined with any constraint x already has."""
+    # overlays, such as the one unify_all collects bindings in, keep attributes in the store beneath them
+    return update_base_dispatch(s, lambda base: _attach(x, c, base))
+
+
+def _attach(
+    x: Var, c: Constraint, s: Substitution
+) -> typing.Union[ConstraintStore, Failure]:
+    if not isinstance(s, ConstraintStore):
+        s = ConstraintStore(s)
+    existing = s.attributes.get(x)
+    if existing is not None:
+        combined = existing.combine(c)
+        if not combined:
+            return Failure(Mismatch, existing, c, s)
+        c = combined
+    return ConstraintStore(s.substitution, s.attributes.set(x, c))
+
+
+def propagate(
+    s: ConstraintStore, bound: typing.Iterable[Var]
+) -> typing.Union[ConstraintStore, Failure]:
+    """Re-check the constraints attached to the variables that were just bound.
+
+    A variable bound to a value has its constraint checked against the value. A variable bound to another
+    unbound variable hands its constraint on to that variable.
+    """
+    attributes = s.attributes
+    substitution = s.substitution
+    worklist = [x for x in bound if x in attributes]
+    while worklist:
+        x = worklist.pop()
+        c = attributes.get(x)
+        if c is None:
+            continue
+        attributes = attributes.delete(x)
+
+        v = walk(x, substitution)
+        if isinstance(v, Var):
+            existing = attributes.get(v)
+            if existing is not None:
+                combined = existing.combine(c)
+                if not combined:
+                    return Failure(Mismatch, existing, c, s)
+                c = combined
+            attributes = attributes.set(v, c)
+        elif not c.check(v):
+            return Failure(Mismatch, c, v, s)
+    return ConstraintStore(substitution, attributes)
+
+
+@extend_dispatch.register
+def extend_constraint_store(s: ConstraintStore, x: Term, v: Term):
+    substitution = extend_dispatch(s.substitution, x, v)
+    return propagate(ConstraintStore(substitution, s.attributes), (x,))
+
+
+@update_dispatch.register
+def update_constraint_store(s: ConstraintStore, bindings: Substitution):
+    substitution = update_dispatch(s.substitution, bindings)
+    return propagate(ConstraintStore(substitution, s.attributes), list(bindings))
+
+
+@compact_dispatch.register
+def compact_constraint_store(s: ConstraintStore, bindings, terms):
+    substitution = compact_dispatch(s.substitution, bindings, terms)
+    attributes = s.attributes
+    attributes = Hamt((x, attributes[x]) for x in find_keys(terms, attributes))
+    return ConstraintStore(substitution, attributes)
+
+
 @unify_dispatch.register(swap=True)
 def unify_constraints(u: Constraint, v: Any, s):
     if u.check(v):
         return s
-    raise Mismatch(u, v)
+    return None
 
 
-@unify_dispatch.register()
+@unify_dispatch.register(swap=True)
 def unify_constraints(u: Constraint, v: Var, s):
-    # It's tricky...
-    #   after walking, a variable associated with a constraint is replaced by the constraint.
-    #   so how can we update the constraint here?
-    raise NotImplementedError()
+    return attach(v, u, s)
 
 
 @unify_dispatch.register()
 def unify_constraints(u: Constraint, v: Constraint, s):
     if not u.combine(v):
-        raise Mismatch(u, v)
+        return None
     return s
 
 
+@match_dispatch.register
+def match_constraint(p: Constraint, t, s):
+    if p.check(t):
+        return s
+    return None
+
+
 @occurs_dispatch.register
 def occurs_constraint(v: Constraint, x, s):
     return False
@@ -0,0 +1,207 @@
+"""Unification of Python containers.
+
+Importing this module lets tuples, lists and dicts be used as compound terms. Tuples and lists expose their
+elements as children, so the engine unifies them element-wise without recursion, rejects containers of different
+lengths before looking at any element, and walk_star returns containers in which nothing changed as they are.
+The containers themselves are used as the children, so no intermediate sequences are allocated.
+
+Tuples know their variables, which are cached for recently used tuples, so ground tuples are compared with ==
+instead of element by element, and skipped by the occurs check. Lists are mutable, so their variables are not
+cached, and the engine descends into them.
+
+Dicts unify if they have the same keys and the values of each key unify. Their children are their keys, compared
+as a constant before anything else, followed by their values in the order of the hashes of their keys, so the
+engine handles nested dicts without recursion too. Keys are treated as constants. Dicts with distinct keys of
+equal hashes have no children, and are handled by recursive handlers instead.
+"""
+
+from collections import OrderedDict
+import typing
+
+from core import (
+    Substitution,
+    Term,
+    children_dispatch,
+    match,
+    match_dispatch,
+    occurs,
+    occurs_dispatch,
+    rebuild_dispatch,
+    unify_dispatch,
+    unify_pairs,
+    variables_dispatch,
+    walk_dispatch,
+    walk_star,
+)
+from variable import Var
+
+
+@children_dispatch.register
+def tuple_children(v: tuple):
+    return v
+
+
+@rebuild_dispatch.register
+def rebuild_tuple(v: tuple, children):
+    if type(v) is tuple:
+        return tuple(children)
+    # named tuples take their fields as arguments
+    return type(v)(*children)
+
+
+@children_dispatch.register
+def list_children(v: list):
+    return v
+
+
+@rebuild_dispatch.register
+def rebuild_list(v: list, children):
+    if type(v) is list:
+        return list(children)
+    return type(v)(children)
+
+
+@variables_dispatch.register
+def tuple_variables(v: tuple):
+    try:
+        entry = _tuple_variables[id(v)]
+    except KeyError:
+        return _cache_variables(v)
+    _tuple_variables.move_to_end(id(v))
+    return entry[1]
+
+
+# (tuple, variables, depth) by id of the tuple, for the most recently used tuples. Tuples can not carry their
+# variables themselves, so they are kept alive here instead, which keeps their ids from being reused.
+_tuple_variables = OrderedDict()
+_CACHE_SIZE = 1 << 16
+# ground terms are compared with ==, which recurses in C, so deeper tuples do not report their variables
+_MAX_DEPTH = 200
+
+
+def _cache_variables(root: tuple) -> typing.Optional[typing.FrozenSet[Var]]:
+    """Find the variables of root and of the tuples in it, bottom up and without recursion, and cache them."""
+    found = {}
+    stack = [root]
+    while stack:
+        v = stack[-1]
+        if id(v) in found:
+            stack.pop()
+            continue
+        pending = [
+            a
+            for a in v
+            if type(a) is tuple and id(a) not in found and id(a) not in _tuple_variables
+        ]
+        if pending:
+            stack.extend(pending)
+            continue
+        stack.pop()
+        found[id(v)] = (v, *_variables_of(v, found))
+
+    for key, entry in found.items():
+        _tuple_variables[key] = entry
+    while len(_tuple_variables) > _CACHE_SIZE:
+        _tuple_variables.popitem(last=False)
+    return found[id(root)][1]
+
+
+def _variables_of(v: tuple, found: typing.Dict) -> typing.Tuple:
+    """Return the variables and the depth of v, whose elements that are tuples are in found or in the cache."""
+    variables = set()
+    depth = 1
+    for a in v:
+        if isinstance(a, Var):
+            variables.add(a)
+        elif type(a) is tuple:
+            _, inner, inner_depth = found.get(id(a)) or _tuple_variables[id(a)]
+            if inner is None:
+                return None, inner_depth
+            variables.update(inner)
+            depth = max(depth, inner_depth + 1)
+        elif children_dispatch(a) is not None:
+            inner = variables_dispatch(a)
+            if inner is None:
+                return None, depth
+            variables.update(inner)
+        elif walk_dispatch.dispatch(type(a)) is not walk_dispatch.dispatch(object):
+            # opaque terms may hide variables
+            return None, depth
+    if depth > _MAX_DEPTH:
+        return None, depth
+    return (frozenset(variables) if variables else _NO_VARIABLES), depth
+
+
+_NO_VARIABLES = frozenset()
+
+
+@children_dispatch.register
+def dict_children(v: dict):
+    # The keys come first, then the values in the order of the hashes of their keys, which is the same for dicts
+    # with the same keys. Dicts with keys of equal hashes are left to unify_dicts.
+    keys = sorted(v, key=hash)
+    for a, b in zip(keys, keys[1:]):
+        if hash(a) == hash(b):
+            return None
+    return (_Keys(keys), *[v[k] for k in keys])
+
+
+@rebuild_dispatch.register
+def rebuild_dict(v: dict, children):
+    result = v.copy()
+    for k, a in zip(children[0].keys, children[1:]):
+        result[k] = a
+    return result
+
+
+class _Keys:
+    """Keys of a dict in the order of their hashes, which is compared as a constant."""
+
+    __slots__ = ("keys",)
+
+    def __init__(self, keys: typing.List):
+        self.keys = keys
+
+    def __eq__(self, other):
+        return type(other) is _Keys and self.keys == other.keys
+
+    def __hash__(self):
+        return hash(tuple(self.keys))
+
+
+# The handlers below are only reached for dicts without children, or for a dict and a term of another type.
+
+
+@unify_dispatch.register()
+def unify_dicts(u: dict, v: dict, s):
+    if len(u) != len(v) or u.keys() != v.keys():
+        return None
+    return unify_pairs([(a, v[k]) for k, a in u.items()], s)
+
+
+@match_dispatch.register
+def match_dict(p: dict, t, s):
+    if not isinstance(t, dict) or len(p) != len(t) or p.keys() != t.keys():
+        return None
+    for k, a in p.items():
+        s = match(a, t[k], s)
+        if s is None:
+            return None
+    return s
+
+
+@occurs_dispatch.register
+def occurs_dict(v: dict, x: Term, s: Substitution) -> bool:
+    return any(occurs(x, a, s) for a in v.values())
+
+
+@walk_dispatch.register
+def walk_dict(v: dict, s: Substitution) -> typing.Dict:
+    result = None
+    for k, a in v.items():
+        b = walk_star(a, s)
+        if b is not a:
+            if result is None:
+                result = v.copy()
+            result[k] = b
+    return v if result is None else result
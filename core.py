@@ -4,15 +4,35 @@ The core does not make any assumptions about what concrete types can be unified.
 
 Primarily, it provides the unify function, which unifies two terms and updates the substitution.
 
+Substitutions are mappings from variables to terms. Plain dicts work, as does any mapping that supports
+`s | {x: v}` to create an extended copy, such as the persistent Hamt.
+
 The behavior of unify can be extended by registering handlers for new types using the following decorators:
 
     1. @unify_dispatch.register, for unification handlers
     2. @occurs_dispatch.register, for occurs check handlers
+    3. @children_dispatch.register and @rebuild_dispatch.register, for compound terms whose subterms the engine
+       may traverse itself. Unification, walk_star and the occurs check handle such terms without recursion.
+    4. @variables_dispatch.register, for compound terms that know their variables without traversal.
+
+The match function is a one-way variant of unify, extended with @match_dispatch.register.
+
+How strictly bindings are checked for cycles is configured with set_occurs_policy or occurs_policy.
+
+The compact function shrinks a substitution to the bindings that some terms still depend on.
+
+New kinds of substitutions can be supported by registering @extend_dispatch.register and
+@update_dispatch.register handlers, and @compact_dispatch.register handlers for compact. Handlers that store
+more than bindings, such as constraints, reach the substitution beneath overlays with update_base_dispatch.
 """
 
+from collections.abc import Mapping
+from contextlib import contextmanager
 from functools import singledispatch
 import typing
 
+from hamt import Hamt
+
 
 class Mismatch(Exception):
     """Two terms could not be matched"""
@@ -22,64 +42,660 @@ class Cycle(Exception):
     """Unification would result in a cycle"""
 
 
+class Failure:
+    """Failed unification, returned instead of raising an exception.
+
+    Only the exception type and its arguments are stored. The exception itself, along with its traceback, is
+    created by the exception method if and when somebody asks for it.
+    """
+
+    __slots__ = ("error", "args")
+
+    def __init__(self, error: typing.Type[Exception], *args):
+        self.error = error
+        self.args = args
+
+    def exception(self) -> Exception:
+        return self.error(*self.args)
+
+    def __repr__(self):
+        return f"Failure({self.error.__name__})"
+
+
 Term = typing.Any
-Substitution = typing.Dict
+Substitution = typing.Mapping
+
+_missing = object()
 
 
 def unify(u: Term, v: Term, s: Substitution) -> Substitution:
-    """Unify two terms subject to a substitution, and return the resulting substitution."""
-    u = walk(u, s)
-    v = walk(v, s)
+    """Unify two terms subject to a substitution, and return the resulting substitution.
 
-    if u == v:
-        return s
+    Terms that expose their children (see children_dispatch) are unified element-wise from an explicit work
+    stack, so arbitrarily deep terms do not grow the Python stack. All other terms are passed to unify_dispatch.
+    """
+    result = _unify(u, v, s)
+    if type(result) is Failure:
+        raise result.exception()
+    return result
 
-    return unify_dispatch(u, v, s)
 
+def try_unify(u: Term, v: Term, s: Substitution) -> typing.Optional[Substitution]:
+    """Unify two terms like unify, but return None instead of raising if they cannot be unified.
 
-def walk(v: Term, s: Substitution) -> Term:
-    """Recursively look up a term in the substitution."""
+    Failures found by the engine or signalled by handlers that return None or a Failure cost no exception.
+    Handlers that still raise Mismatch or Cycle are supported as well.
+    """
     try:
-        a = s[v]
-    except KeyError:
+        result = _unify(u, v, s)
+    except (Mismatch, Cycle):
+        return None
+    if type(result) is Failure:
+        return None
+    return result
+
+
+def _unify(u: Term, v: Term, s: Substitution) -> typing.Union[Substitution, Failure]:
+    policy = _occurs_policy
+    if policy == STRICT:
+        return unify_pairs([(u, v)], s)
+    if policy == NONE:
+        return unify_pairs([(u, v)], s, {})
+    # the new bindings are collected in an overlay, so that the cycle check only looks at them
+    system = unify_pairs([(u, v)], _System(Hamt(), s), {})
+    if type(system) is Failure:
+        return system
+    return _commit(system, policy)
+
+
+def unify_all(
+    equations: typing.Iterable[typing.Tuple[Term, Term]], s: Substitution
+) -> Substitution:
+    """Unify all pairs of terms in equations as one system, and return the resulting substitution.
+
+    The result is equivalent to folding unify over the pairs, but cheaper for large systems: new bindings are
+    collected in a persistent overlay over s instead of copying s, bindings are not checked for cycles one by
+    one, and each pair of compound terms is unified at most once. A single cycle check over the new bindings
+    runs at the end and raises Cycle if the system has no finite solution, unless the occurs policy is NONE.
+    """
+    policy = _occurs_policy
+    system = _System(Hamt(), s)
+    pairs = []
+    seen = {}
+    for equation in equations:
+        pairs.append(equation)
+        system = unify_pairs(pairs, system, seen)
+        if type(system) is Failure:
+            raise system.exception()
+
+    result = _commit(system, policy)
+    if type(result) is Failure:
+        raise result.exception()
+    return result
+
+
+def _commit(system: "_System", policy: str) -> typing.Union[Substitution, Failure]:
+    """Check the bindings collected in system for cycles, unless policy is NONE, and add them to its base."""
+    if policy != NONE:
+        check_cycles(system, system.bindings)
+    # handlers may have replaced the base, for example to record constraints
+    return update_dispatch(system.base, system.bindings)
+
+
+def unify_pairs(
+    pairs: typing.List[typing.Tuple[Term, Term]],
+    s: Substitution,
+    seen: typing.Optional[typing.Dict] = None,
+) -> Substitution:
+    """Unify the pairs of terms on the work stack until it is empty, and return the resulting substitution.
+    If unification fails, a Failure is returned instead and the remaining pairs are left on the stack.
+
+    If seen is given, pairs of compound terms are recorded in it by identity and skipped when they come up again.
+    This shares work between repeated subterms and guarantees termination when occurs checks are deferred.
+    """
+    while pairs:
+        u, v = pairs.pop()
+        u = walk(u, s)
+        v = walk(v, s)
+
+        if u is v:
+            continue
+
+        if type(u) is type(v):
+            cu = children_dispatch(u)
+            if cu is not None and not (_is_ground(u) and _is_ground(v)):
+                cv = children_dispatch(v)
+                if cv is not None and len(cu) == len(cv):
+                    if seen is not None:
+                        key = (id(u), id(v))
+                        if key in seen:
+                            continue
+                        # keep the terms alive so that their ids are not reused
+                        seen[key] = (u, v)
+                    pairs.extend(zip(reversed(cu), reversed(cv)))
+                    continue
+
+        if u == v:
+            continue
+
+        result = unify_dispatch(u, v, s)
+        if result is None:
+            return Failure(Mismatch, u, v, s)
+        if type(result) is Failure:
+            return result
+        s = result
+    return s
+
+
+def match(pattern: Term, term: Term, s: Substitution) -> typing.Optional[Substitution]:
+    """Bind the variables of pattern so that it equals term, and return the resulting substitution, or None if
+    that is not possible.
+
+    Matching is one-way: variables in term are treated as constants and never bound, term is not looked up in the
+    substitution, and bindings are not checked for cycles. A pattern variable that is already bound matches terms
+    equal to its value, which is term data and not looked up either. Subterms of pattern that expose their
+    children are matched element-wise against terms of the same type, ground ones by equality. Everything else is
+    passed to match_dispatch.
+    """
+    pairs = [(pattern, term)]
+    while pairs:
+        p, t = pairs.pop()
+        if p is t:
+            continue
+
+        value = _lookup(p, s)
+        if value is not p:
+            # the value of a bound pattern variable is data, so its variables are neither bound nor looked up
+            if not _equal(value, t):
+                return None
+            continue
+
+        if type(p) is type(t):
+            if _is_ground(p):
+                if p == t:
+                    continue
+                return None
+            cp = children_dispatch(p)
+            if cp is not None:
+                ct = children_dispatch(t)
+                if ct is not None and len(cp) == len(ct):
+                    pairs.extend(zip(cp, ct))
+                    continue
+
+        try:
+            result = match_dispatch(p, t, s)
+        except (Mismatch, Cycle):
+            return None
+        if result is None or type(result) is Failure:
+            return None
+        s = result
+    return s
+
+
+def _equal(u: Term, v: Term) -> bool:
+    """Test if u and v are equal, comparing terms that expose their children element-wise."""
+    return _equal_pairs([(u, v)])
+
+
+def _equal_pairs(pairs: typing.List[typing.Tuple[Term, Term]]) -> bool:
+    """Test if the terms of each pair are equal, like _equal. The list is consumed."""
+    while pairs:
+        u, v = pairs.pop()
+        if u is v:
+            continue
+        if type(u) is type(v):
+            cu = children_dispatch(u)
+            if cu is not None:
+                cv = children_dispatch(v)
+                if cv is not None and len(cu) == len(cv):
+                    pairs.extend(zip(cu, cv))
+                    continue
+        if u != v:
+            return False
+    return True
+
+
+def _lookup(v: Term, s: Substitution) -> Term:
+    """Return the binding of v in s, or v itself if it is not bound. Unlike walk, bindings are not followed."""
+    if _is_compound(v):
         return v
+    try:
+        return s.get(v, v)
     except TypeError:
         return v
-    else:
-        return walk(a, s)
+
+
+def walk(v: Term, s: Substitution) -> Term:
+    """Recursively look up a term in the substitution."""
+    # terms with children are never bound, and hashing them to find out may take time linear in their size
+    get = s.get
+    while not _is_compound(v):
+        try:
+            a = get(v, _missing)
+        except TypeError:
+            return v
+        if a is _missing:
+            return v
+        v = a
+    return v
 
 
 def walk_star(v: Term, s: Substitution) -> Term:
-    """Recursively look up a term and its subterms in the substitution."""
+    """Recursively look up a term and its subterms in the substitution.
+
+    Terms that expose their children are rebuilt from an explicit stack; other terms are passed to walk_dispatch.
+    Subterms are resolved once per call, so shared subterms stay shared in the result, and terms in which
+    nothing changed are returned as they are.
+    """
+    return _walk_star(v, s, {})
+
+
+def walk_star_all(terms: typing.Iterable[Term], s: Substitution) -> typing.List[Term]:
+    """Apply walk_star to all terms. Subterms that the terms share are resolved only once."""
+    memo = {}
+    return [_walk_star(v, s, memo) for v in terms]
+
+
+def compact(s: Substitution, roots: typing.Iterable[Term]) -> Substitution:
+    """Return a substitution of the same kind as s that binds only the variables reachable from roots, each to
+    its fully resolved term. Bindings that no root depends on are dropped.
+
+    Walking the roots in the result gives the same terms as walking them in s. Variables that are not reachable
+    from the roots lose their bindings, so every term that is still in use must be among the roots.
+    """
+    roots = list(roots)
+    reachable = find_keys(roots, s)
+    resolved = walk_star_all([*reachable, *roots], s)
+    bindings = dict(zip(reachable, resolved))
+    return compact_dispatch(s, bindings, resolved)
+
+
+def find_keys(terms: typing.Iterable[Term], mapping: typing.Mapping) -> typing.List:
+    """Return the keys of mapping that occur in terms, in order of first occurrence.
+
+    Terms are searched wherever walk_star looks, including inside opaque terms, but nothing is looked up: a key
+    bound in mapping is not followed to its value.
+    """
+    tracing = _Tracing(mapping)
+    walk_star_all(terms, tracing)
+    return list(tracing.found)
+
+
+def _walk_star(v: Term, s: Substitution, memo: typing.Dict) -> Term:
+    # memo maps the ids of compound terms to the term and its resolved form, which keeps the term alive
     v = walk(v, s)
-    return walk_dispatch(v, s)
+    kids = children_dispatch(v)
+    if kids is None:
+        return walk_dispatch(v, s)
+    known = memo.get(id(v))
+    if known is not None:
+        return known[1]
+    if _is_resolved(v, s):
+        return v
+
+    # Each frame holds a term, its children, and the already resolved children. Unless the occurs policy rules
+    # out cycles, the terms on the stack are tracked to detect cyclic terms.
+    stack = [(v, kids, [])]
+    active = None if _checks_occurs(s) else {id(v)}
+    while True:
+        v, kids, done = stack[-1]
+        if len(done) < len(kids):
+            c = walk(kids[len(done)], s)
+            ck = children_dispatch(c)
+            if ck is None:
+                done.append(walk_dispatch(c, s))
+                continue
+            known = memo.get(id(c))
+            if known is not None:
+                done.append(known[1])
+            elif _is_resolved(c, s):
+                done.append(c)
+            else:
+                if active is not None:
+                    if id(c) in active:
+                        raise Cycle(c, c, s)
+                    active.add(id(c))
+                stack.append((c, ck, []))
+            continue
+
+        stack.pop()
+        if active is not None:
+            active.discard(id(v))
+        if any(a is not b for a, b in zip(done, kids)):
+            result = rebuild_dispatch(v, done)
+        else:
+            result = v
+        memo[id(v)] = (v, result)
+        if not stack:
+            return result
+        stack[-1][2].append(result)
 
 
 def occurs(x: Term, v: Term, s: Substitution) -> bool:
     """Test if a variable occurs in a term, subject to a substitution"""
-    v = walk(v, s)
-    return occurs_dispatch(v, x, s)
+    todo = [v]
+    seen = set()
+    while todo:
+        v = walk(todo.pop(), s)
+        kids = children_dispatch(v)
+        if kids is None:
+            found = occurs_dispatch(v, x, s)
+            if found:
+                return found
+        elif id(v) not in seen:
+            seen.add(id(v))
+            variables = variables_dispatch(v)
+            todo.extend(kids if variables is None else variables)
+    return False
+
+
+def _is_ground(v: Term) -> bool:
+    variables = variables_dispatch(v)
+    return variables is not None and not variables
+
+
+def _is_resolved(v: Term, s: Substitution) -> bool:
+    """Test if none of v's variables is bound in s, so that walk_star would return v itself."""
+    variables = variables_dispatch(v)
+    if variables is None:
+        return False
+    get = s.get
+    for x in variables:
+        if get(x, _missing) is not _missing:
+            return False
+    return True
 
 
 def extend_substitution(x: Term, v: Term, s: Substitution) -> Substitution:
     """Extend a substitution by associating a term with a variable.
     If this would result in a cycle, the Cycle exception is thrown."""
-    if occurs(x, v, s):
-        raise Cycle(x, v, s)
-    return s | {x: v}
+    result = bind(x, v, s)
+    if type(result) is Failure:
+        raise result.exception()
+    return result
+
+
+def bind(x: Term, v: Term, s: Substitution) -> typing.Union[Substitution, Failure]:
+    """Extend a substitution by associating a term with a variable, like extend_substitution.
+    If this would result in a cycle, a Failure is returned."""
+    if _checks_occurs(s) and occurs(x, v, s):
+        return Failure(Cycle, x, v, s)
+    return extend_dispatch(s, x, v)
+
+
+# Occurs check policies
+STRICT = "strict"  # check every binding, so substitutions never contain cycles
+# do not check bindings one by one; unify, try_unify and unify_all check the new bindings with check_cycles
+DEFERRED = "deferred"
+NONE = "none"  # do not check at all, for unification of rational trees
+
+_occurs_policy = STRICT
+
+
+def set_occurs_policy(policy: str) -> str:
+    """Set the occurs check policy of the engine and return the previous one.
+
+    With STRICT, extend_substitution raises Cycle as soon as a binding would create a cycle. With DEFERRED or
+    NONE, bindings are not checked one by one. Cycles are then found by check_cycles, which unify, try_unify and
+    unify_all run over the new bindings for DEFERRED, or by walk_star, which cannot resolve a cyclic term.
+
+    The occurs check of a binding traverses the bound term and every term reached through bindings, so STRICT
+    visits terms shared by several bindings, or reached through chains of them, once per binding. check_cycles
+    visits each of them once per unification, so DEFERRED saves work when a unification makes many bindings
+    that share terms, and costs about the same as STRICT when it makes a single binding.
+    """
+    global _occurs_policy
+    if policy not in (STRICT, DEFERRED, NONE):
+        raise ValueError(f"unknown occurs check policy: {policy!r}")
+    previous, _occurs_policy = _occurs_policy, policy
+    return previous
+
+
+def _checks_occurs(s: Substitution) -> bool:
+    """Test if bindings in s are checked for cycles one by one. Systems of unify_all and unify with the DEFERRED
+    policy are checked once all their bindings are known."""
+    return _occurs_policy == STRICT and type(s) is not _System
+
+
+def get_occurs_policy() -> str:
+    """Return the occurs check policy of the engine."""
+    return _occurs_policy
+
+
+@contextmanager
+def occurs_policy(policy: str):
+    """Use the given occurs check policy within a with block."""
+    previous = set_occurs_policy(policy)
+    try:
+        yield
+    finally:
+        set_occurs_policy(previous)
+
+
+def check_cycles(
+    s: Substitution, variables: typing.Optional[typing.Iterable[Term]] = None
+):
+    """Raise Cycle if any of the variables is bound to a term that contains the variable itself, subject to s.
+    By default, all variables bound in s are checked.
+
+    Runs in time linear in the size of the terms reachable from the variables, as far as their children are
+    exposed. Bindings that lead to opaque terms, whose subterms only walk_dispatch can see, are then checked
+    one by one with occurs.
+    """
+    variables = list(s if variables is None else variables)
+
+    # Depth first search through bindings and children. Nodes are kept alive in the states so that their ids
+    # are not reused. A node's state is None while it is on the current path and afterwards tells whether an
+    # opaque term is reachable from it.
+    state = {}
+    suspicious = []
+    for root in variables:
+        if id(root) in state:
+            continue
+        state[id(root)] = (root, None)
+        stack = [[root, iter(_successors(root, s)), False]]
+        while stack:
+            frame = stack[-1]
+            for child in frame[1]:
+                known = state.get(id(child))
+                if known is None:
+                    state[id(child)] = (child, None)
+                    stack.append(
+                        [child, iter(_successors(child, s)), _is_opaque(child, s)]
+                    )
+                    break
+                if known[1] is None:
+                    raise Cycle(root, _lookup(root, s), s)
+                frame[2] = frame[2] or known[1]
+            else:
+                stack.pop()
+                node, _, reaches_opaque = frame
+                state[id(node)] = (node, reaches_opaque)
+                if stack:
+                    stack[-1][2] = stack[-1][2] or reaches_opaque
+
+    for x in variables:
+        if state[id(x)][1]:
+            suspicious.append(x)
+    if not suspicious:
+        return
+
+    # Every cycle through an opaque term passes through a suspicious binding, so the substitution without them
+    # is acyclic. Adding them back one at a time keeps it acyclic, which every occurs check relies on.
+    acyclic = _Hiding(s, set(suspicious))
+    for x in suspicious:
+        t = s[x]
+        if occurs(x, t, acyclic):
+            raise Cycle(x, t, s)
+        acyclic.hidden.discard(x)
+
+
+def _successors(t: Term, s: Substitution) -> typing.Sequence[Term]:
+    # terms of compound types are never bound, so they are not hashed to look them up
+    if not _is_compound(t):
+        try:
+            bound = s.get(t, _missing)
+        except TypeError:
+            return ()
+        return () if bound is _missing else (bound,)
+    # cycles pass through variables, so terms that know their variables are skipped to them
+    variables = variables_dispatch(t)
+    if variables is not None:
+        return variables
+    kids = children_dispatch(t)
+    return () if kids is None else kids
+
+
+def _is_opaque(t: Term, s: Substitution) -> bool:
+    """Test if t is an unbound term whose subterms are hidden from the engine."""
+    if not _is_compound(t):
+        try:
+            if t in s:
+                return False
+        except TypeError:
+            pass
+    elif children_dispatch(t) is not None:
+        return False
+    return walk_dispatch.dispatch(type(t)) is not walk_dispatch.dispatch(object)
+
+
+class _System(Mapping):
+    """Persistent overlay of new bindings over a base substitution, used by unify_all."""
+
+    __slots__ = ("bindings", "base")
+
+    def __init__(self, bindings: Hamt, base: Substitution):
+        self.bindings = bindings
+        self.base = base
+
+    def get(self, key, default=None):
+        v = self.bindings.get(key, _missing)
+        if v is _missing:
+            return self.base.get(key, default)
+        return v
+
+    def __getitem__(self, key):
+        v = self.get(key, _missing)
+        if v is _missing:
+            raise KeyError(key)
+        return v
+
+    def __iter__(self):
+        yield from self.bindings
+        for k in self.base:
+            if k not in self.bindings:
+                yield k
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class _Hiding(Mapping):
+    """View of a substitution in which some variables are unbound."""
+
+    __slots__ = ("base", "hidden")
+
+    def __init__(self, base: Substitution, hidden: typing.Set):
+        self.base = base
+        self.hidden = hidden
 
+    def get(self, key, default=None):
+        if key in self.hidden:
+            return default
+        return self.base.get(key, default)
 
-def unify_dispatch(u: Term, v: Term, s: Substitution) -> Substitution:
+    def __getitem__(self, key):
+        v = self.get(key, _missing)
+        if v is _missing:
+            raise KeyError(key)
+        return v
+
+    def __iter__(self):
+        return (k for k in self.base if k not in self.hidden)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class _Tracing(Mapping):
+    """Empty view of a mapping that records which of the mapping's keys are looked up. Used by find_keys."""
+
+    __slots__ = ("base", "found")
+
+    def __init__(self, base: typing.Mapping):
+        self.base = base
+        self.found = {}
+
+    def get(self, key, default=None):
+        if self.base.get(key, _missing) is not _missing:
+            self.found[key] = None
+        return default
+
+    def __getitem__(self, key):
+        self.get(key)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(())
+
+    def __len__(self):
+        return 0
+
+
+def unify_dispatch(
+    u: Term, v: Term, s: Substitution
+) -> typing.Union[Substitution, Failure]:
     """Unify two walked terms by dispatching to the appropriate handler.
-    Use the unifier decorator to register new handlers."""
-    for predicate, handler in unify_handlers[::-1]:
-        if predicate(u, v):
+    Use the unifier decorator to register new handlers.
+
+    Handlers return the new substitution. To signal failure, they return None or a Failure, or raise Mismatch
+    or Cycle. If no handler applies, a Failure is returned."""
+    try:
+        candidates = dispatch_cache[type(u), type(v)]
+    except KeyError:
+        candidates = dispatch_cache[type(u), type(v)] = resolve_handlers(
+            type(u), type(v)
+        )
+
+    for predicate, handler in candidates:
+        if predicate is None or predicate(u, v):
             return handler(u, v, s)
-    raise Mismatch(u, v, s)
+    return Failure(Mismatch, u, v, s)
 
 
 unify_handlers = []
 
+# Maps pairs of term types to the handlers that may apply to them. Cleared whenever a handler is registered.
+dispatch_cache = {}
+
+
+def resolve_handlers(t1: typing.Type, t2: typing.Type) -> typing.Tuple:
+    """Select the handlers that may apply to terms of types t1 and t2, in the order they are tried.
+
+    Handlers registered by type annotation are decided here once. They are returned with predicate None, and
+    nothing after the first of them can be reached. Custom predicates depend on the terms' values, so they are
+    kept in place and evaluated on every call.
+    """
+    candidates = []
+    for predicate, handler in reversed(unify_handlers):
+        if isinstance(predicate, TypePredicate):
+            if predicate.accepts(t1, t2):
+                candidates.append((None, handler))
+                break
+        else:
+            candidates.append((predicate, handler))
+    return tuple(candidates)
+
+
+@singledispatch
+def match_dispatch(
+    pattern: Term, term: Term, s: Substitution
+) -> typing.Optional[Substitution]:
+    """Match pattern against term. Dispatches to the appropriate handler based on the pattern's type.
+    Handlers return the new substitution, or None if pattern does not match; Mismatch and Cycle are accepted too.
+    By default, pattern matches terms equal to it."""
+    return s if pattern == term else None
+
 
 @singledispatch
 def occurs_dispatch(_v: Term, _x: Term, _s: Substitution) -> bool:
@@ -87,6 +703,110 @@ def occurs_dispatch(_v: Term, _x: Term, _s: Substitution) -> bool:
     return False
 
 
+@singledispatch
+def children_dispatch(_v: Term) -> typing.Optional[typing.Sequence[Term]]:
+    """Return the direct subterms of v, or None if v is atomic or does not expose its subterms.
+    Terms with the same type and number of children are unified by unifying their children.
+    Terms of types that have a handler are assumed to never be bound themselves, so walk does not look them up.
+    """
+    return None
+
+
+# Maps types to whether children_dispatch has a handler for them. Cleared whenever a handler is registered.
+_compound_types = {}
+
+
+def _is_compound(v: Term) -> bool:
+    """Test if children_dispatch has a handler for the type of v. Such terms are never bound."""
+    try:
+        return _compound_types[type(v)]
+    except KeyError:
+        return _is_compound_type(type(v))
+
+
+def _is_compound_type(t: typing.Type) -> bool:
+    result = _compound_types[t] = children_dispatch.dispatch(
+        t
+    ) is not children_dispatch.dispatch(object)
+    return result
+
+
+def _register_children(cls, func=None):
+    _compound_types.clear()
+    return _singledispatch_register(cls, func)
+
+
+_singledispatch_register = children_dispatch.register
+children_dispatch.register = _register_children
+
+
+@singledispatch
+def variables_dispatch(_v: Term) -> typing.Optional[typing.AbstractSet[Term]]:
+    """Return the set of variables in the compound term v, or None if they are not known without traversing v.
+    Terms that know their variables are skipped by the occurs check and walk_star when they are ground.
+    """
+    return None
+
+
+@singledispatch
+def rebuild_dispatch(v: Term, children: typing.Sequence[Term]) -> Term:
+    """Create a term like v, but with the given children. Required for every type that has children."""
+    raise TypeError(f"cannot rebuild {type(v).__name__} from children")
+
+
+@singledispatch
+def extend_dispatch(s: Substitution, x: Term, v: Term) -> Substitution:
+    """Associate x with v in s. Dispatches to the appropriate handler based on the substitution's type.
+    By default, an extended copy is created with `s | {x: v}`. Handlers may return a Failure to reject the binding.
+    """
+    return s | {x: v}
+
+
+@extend_dispatch.register
+def extend_system(s: _System, x: Term, v: Term) -> Substitution:
+    return _System(s.bindings.set(x, v), s.base)
+
+
+@singledispatch
+def update_dispatch(s: Substitution, bindings: Substitution) -> Substitution:
+    """Associate all variables in bindings with their terms in s. Dispatches to the appropriate handler based on
+    the substitution's type. By default, an extended copy is created with `s | bindings`. Handlers may return a
+    Failure to reject the bindings.
+    """
+    return s | dict(bindings.items())
+
+
+@singledispatch
+def update_base_dispatch(
+    s: Substitution,
+    update: typing.Callable[[Substitution], typing.Union[Substitution, Failure]],
+) -> typing.Union[Substitution, Failure]:
+    """Replace the substitution beneath s with the result of calling update on it, or return the Failure that
+    update returned. Overlays, such as the one unify_all collects bindings in, apply update to the substitution
+    they cover; all other substitutions are replaced themselves, which is the default.
+    """
+    return update(s)
+
+
+@update_base_dispatch.register
+def update_system_base(s: _System, update):
+    base = update_base_dispatch(s.base, update)
+    if type(base) is Failure:
+        return base
+    return _System(s.bindings, base)
+
+
+@singledispatch
+def compact_dispatch(
+    s: Substitution, bindings: typing.Dict, _terms: typing.Sequence[Term]
+) -> Substitution:
+    """Create a substitution of the same kind as s that holds only bindings. terms are the resolved roots and
+    bindings of compact; handlers keep any state of unbound variables that occur in them. Dispatches to the
+    appropriate handler based on the substitution's type. By default, `type(s)(bindings)` is created.
+    """
+    return type(s)(bindings)
+
+
 @singledispatch
 def walk_dispatch(v: Term, _s: Substitution) -> bool:
     """Test if x occurs in v given s. Dispatches to the appropriate handler based on v's type."""
@@ -106,20 +826,17 @@ def unifier(
     """
 
     def decorator(handler):
-        unify_handlers.append((predicate, handler))
+        register_handler(predicate, handler)
         return handler
 
     def annotation_unifier(handler):
         types = tuple(handler.__annotations__.values())
-        t1, t2 = types[:2]
-
-        def pred(a, b):
-            return is_instance(a, t1) and is_instance(b, t2)
+        pred = TypePredicate(*types[:2])
 
-        unify_handlers.append((pred, handler))
+        register_handler(pred, handler)
 
         if swap:
-            unify_handlers.append((swap_args(pred), swap_args(handler)))
+            register_handler(pred.swapped(), swap_args(handler))
 
         return handler
 
@@ -132,6 +849,36 @@ def unifier(
 unify_dispatch.register = unifier
 
 
+def register_handler(
+    predicate: typing.Callable[[Term, Term], bool], handler: typing.Callable
+):
+    """Add a unification handler with higher priority than all previously registered handlers."""
+    unify_handlers.append((predicate, handler))
+    dispatch_cache.clear()
+
+
+class TypePredicate:
+    """Predicate that tests if two terms are instances of the given types.
+    Because it only depends on the terms' types, its outcome can be decided once per pair of types.
+    """
+
+    __slots__ = ("t1", "t2")
+
+    def __init__(self, t1: typing.Type, t2: typing.Type):
+        self.t1 = t1
+        self.t2 = t2
+
+    def __call__(self, a: Term, b: Term) -> bool:
+        return is_instance(a, self.t1) and is_instance(b, self.t2)
+
+    def accepts(self, c1: typing.Type, c2: typing.Type) -> bool:
+        """Test if instances of types c1 and c2 satisfy the predicate."""
+        return is_subclass(c1, self.t1) and is_subclass(c2, self.t2)
+
+    def swapped(self) -> "TypePredicate":
+        return TypePredicate(self.t2, self.t1)
+
+
 def is_instance(obj: typing.Any, typ: typing.Type) -> bool:
     """Test if object is an instance of given type. Supports some additional types compared to the builtin."""
     if typ == typing.Any:
@@ -139,6 +886,13 @@ def is_instance(obj: typing.Any, typ: typing.Type) -> bool:
     return isinstance(obj, typ)
 
 
+def is_subclass(cls: typing.Type, typ: typing.Type) -> bool:
+    """Test if cls is a subclass of given type. Supports the same additional types as is_instance."""
+    if typ == typing.Any:
+        return True
+    return issubclass(cls, typ)
+
+
 def swap_args(func):
     """Transform a function to swap its first two arguments"""
 
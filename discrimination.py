@@ -0,0 +1,227 @@
+"""Discrimination tree index for finding stored terms that may unify with a query.
+
+Terms are stored along the path of their preorder traversal. Compound terms contribute their type and number of
+children, atoms of built-in scalar types contribute their value, and variables contribute a wildcard. A lookup
+walks the paths that are compatible with the query, so it only visits stored terms that share its shape instead
+of unifying the query with every stored term:
+
+    index = DiscriminationTree()
+    index.update([(head, rule) for head, rule in rules])
+    for head in index.unifiable(goal):
+        ...
+
+Lookups return candidates, a superset of the answer: a variable that occurs twice may be bound inconsistently,
+and terms without children whose unification the index can not predict, such as constraints or opaque
+structures, match anything. Confirm candidates with unify or try_unify.
+
+Compound terms are assumed to only unify with compound terms of the same type and number of children, which is
+how the engine treats terms that expose their children.
+"""
+
+import typing
+
+from core import Substitution, Term, children_dispatch, walk
+from variable import Var
+
+# keys of the paths in the tree
+_VAR = ("*",)  # variable in a stored term
+_OPAQUE = ("?",)  # stored term that may unify with anything
+
+_ATOMS = (int, float, complex, str, bytes, bool, type(None))
+
+# the three lookups, which differ in how variables on either side are treated
+_UNIFY = 0
+_INSTANCES = 1  # stored terms that the query generalizes
+_GENERALIZATIONS = 2  # stored terms that generalize the query
+
+
+class _Node:
+    __slots__ = ("children", "entries")
+
+    def __init__(self):
+        self.children = {}
+        # pairs of stored terms ending here and their values. A list, because terms need not be hashable.
+        self.entries = None
+
+
+class DiscriminationTree:
+    """Index of terms, each associated with a value."""
+
+    def __init__(self, items: typing.Iterable[typing.Tuple[Term, typing.Any]] = ()):
+        self._root = _Node()
+        self._len = 0
+        self.update(items)
+
+    def insert(self, term: Term, value: typing.Any = None):
+        """Store term with the given value, replacing the value if term is already stored."""
+        node = self._root
+        for key in _path(term):
+            child = node.children.get(key)
+            if child is None:
+                child = node.children[key] = _Node()
+            node = child
+        if node.entries is None:
+            node.entries = []
+        i = _find(node.entries, term)
+        if i is None:
+            node.entries.append((term, value))
+            self._len += 1
+        else:
+            node.entries[i] = (term, value)
+
+    def update(self, items: typing.Iterable[typing.Tuple[Term, typing.Any]]):
+        """Store many terms, given as pairs of term and value."""
+        for term, value in items:
+            self.insert(term, value)
+
+    def remove(self, term: Term):
+        """Remove term from the index. Raises KeyError if it is not stored."""
+        path = []
+        node = self._root
+        for key in _path(term):
+            path.append((node, key))
+            node = node.children.get(key)
+            if node is None:
+                raise KeyError(term)
+        i = None if node.entries is None else _find(node.entries, term)
+        if i is None:
+            raise KeyError(term)
+
+        del node.entries[i]
+        self._len -= 1
+        if node.entries:
+            return
+        node.entries = None
+
+        # prune the branch that led only to term
+        for parent, key in reversed(path):
+            if node.children or node.entries:
+                break
+            del parent.children[key]
+            node = parent
+
+    def remove_all(self, terms: typing.Iterable[Term]):
+        """Remove many terms. Terms that are not stored are ignored."""
+        for term in terms:
+            try:
+                self.remove(term)
+            except KeyError:
+                pass
+
+    def unifiable(self, query: Term, s: Substitution = None) -> typing.List[Term]:
+        """Return the stored terms that may unify with query."""
+        return self._lookup(query, s, _UNIFY)
+
+    def instances(self, query: Term, s: Substitution = None) -> typing.List[Term]:
+        """Return the stored terms that may be instances of query, that is, that query matches."""
+        return self._lookup(query, s, _INSTANCES)
+
+    def generalizations(self, query: Term, s: Substitution = None) -> typing.List[Term]:
+        """Return the stored terms that may generalize query, that is, that match query."""
+        return self._lookup(query, s, _GENERALIZATIONS)
+
+    def _lookup(self, query: Term, s: Substitution, mode: int) -> typing.List[Term]:
+        found = []
+        # states of the search: a node, the query subterms that remain, as a linked list, and the number of
+        # stored subterms to skip because they are matched by a query variable
+        stack = [(self._root, (query, None), 0)]
+        while stack:
+            node, todo, skip = stack.pop()
+
+            if skip:
+                for key, child in node.children.items():
+                    stack.append((child, todo, skip - 1 + _arity(key)))
+                continue
+
+            if todo is None:
+                if node.entries:
+                    found.extend(term for term, _ in node.entries)
+                continue
+
+            t, rest = todo
+            if s is not None:
+                t = walk(t, s)
+            key = _key(t)
+
+            if key is _VAR or key is _OPAQUE:
+                if mode == _GENERALIZATIONS and key is _VAR:
+                    # only stored variables generalize a variable
+                    for k in (_VAR, _OPAQUE):
+                        child = node.children.get(k)
+                        if child is not None:
+                            stack.append((child, rest, 0))
+                else:
+                    for k, child in node.children.items():
+                        stack.append((child, rest, _arity(k)))
+                continue
+
+            if mode != _INSTANCES:
+                child = node.children.get(_VAR)
+                if child is not None:
+                    stack.append((child, rest, 0))
+            child = node.children.get(_OPAQUE)
+            if child is not None:
+                stack.append((child, rest, 0))
+
+            child = node.children.get(key)
+            if child is not None:
+                kids = children_dispatch(t)
+                if kids is not None:
+                    for kid in reversed(kids):
+                        rest = (kid, rest)
+                stack.append((child, rest, 0))
+        return found
+
+    def __getitem__(self, term: Term) -> typing.Any:
+        node = self._root
+        for key in _path(term):
+            node = node.children.get(key)
+            if node is None:
+                raise KeyError(term)
+        i = None if node.entries is None else _find(node.entries, term)
+        if i is None:
+            raise KeyError(term)
+        return node.entries[i][1]
+
+    def __contains__(self, term: Term) -> bool:
+        try:
+            self[term]
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self):
+        return self._len
+
+
+def _find(entries: typing.List, term: Term) -> typing.Optional[int]:
+    for i, (t, _) in enumerate(entries):
+        if t is term or t == term:
+            return i
+    return None
+
+
+def _key(t: Term) -> typing.Tuple:
+    if isinstance(t, Var):
+        return _VAR
+    kids = children_dispatch(t)
+    if kids is not None:
+        return ("f", type(t), len(kids))
+    if isinstance(t, _ATOMS):
+        return ("c", t)
+    return _OPAQUE
+
+
+def _arity(key: typing.Tuple) -> int:
+    return key[2] if key[0] == "f" else 0
+
+
+def _path(term: Term) -> typing.Iterator[typing.Tuple]:
+    """Produce the keys of term in preorder."""
+    stack = [term]
+    while stack:
+        t = stack.pop()
+        key = _key(t)
+        yield key
+        if key[0] == "f":
+            stack.extend(reversed(children_dispatch(t)))
@@ -0,0 +1,427 @@
+"""Finite-domain constraints.
+
+Variables are restricted to finite sets of integers by unifying them with a domain. Domain is a set of integers
+stored as the bits of a Python int, counted from an offset, so intersecting two domains is a shift and an `&`.
+Interval is a range of integers, which combines with other intervals without materializing their values.
+Combining any two of them intersects them, and the empty intersection fails. A Domain and an Interval with the
+same values are equal.
+
+Binary constraints between variables, such as NotEqual or Before, are not checked one value at a time. ac3 prunes
+the domains of their variables until every remaining value of a variable has a supporting value in the domains of
+the others, and solve searches the pruned domains, propagating again after each choice:
+
+    s = unify_all([(x, Interval(0, 9)), (y, Interval(0, 9))], ConstraintStore())
+    s = ac3([Before(x, y, 5)], s)  # x in 0..4, y in 5..9
+"""
+
+from abc import ABC, abstractmethod
+from collections import deque
+import typing
+
+from constraint import Constraint, ConstraintStore
+from core import Substitution, Term, extend_dispatch, try_unify, walk
+from variable import Var
+
+
+class Domain(Constraint):
+    """Finite set of integers. Bit i of bits is set if offset + i is in the set."""
+
+    __slots__ = ("bits", "offset")
+
+    def __init__(self, bits: int, offset: int = 0):
+        # the lowest bit is kept set, so that equal sets have equal bits and offsets
+        if bits:
+            low = (bits & -bits).bit_length() - 1
+            bits >>= low
+            offset += low
+        else:
+            offset = 0
+        self.bits = bits
+        self.offset = offset
+
+    @classmethod
+    def of(cls, values: typing.Iterable[int]) -> "Domain":
+        values = list(values)
+        if not values:
+            return cls(0)
+        offset = min(values)
+        bits = 0
+        for value in values:
+            bits |= 1 << (value - offset)
+        return cls(bits, offset)
+
+    @classmethod
+    def interval(cls, lo: int, hi: int) -> "Domain":
+        """Return the integers between lo and hi inclusive."""
+        if hi < lo:
+            return cls(0)
+        return cls((1 << (hi - lo + 1)) - 1, lo)
+
+    @property
+    def min(self) -> int:
+        return self.offset
+
+    @property
+    def max(self) -> int:
+        return self.offset + self.bits.bit_length() - 1
+
+    def restrict(self, lo: int, hi: int) -> "Domain":
+        """Return the values of this domain between lo and hi inclusive."""
+        lo, hi = max(lo - self.offset, 0), min(hi, self.max) - self.offset
+        if hi < lo:
+            return Domain(0)
+        return Domain(self.bits & ((1 << (hi + 1)) - (1 << lo)), self.offset)
+
+    def discard(self, value: int) -> "Domain":
+        """Return this domain without value."""
+        if value not in self:
+            return self
+        return Domain(self.bits & ~(1 << (value - self.offset)), self.offset)
+
+    def check(self, value: Term) -> bool:
+        return (
+            type(value) is int
+            and value >= self.offset
+            and (self.bits >> (value - self.offset)) & 1 == 1
+        )
+
+    def combine(self, other: Constraint) -> typing.Optional["Domain"]:
+        if isinstance(other, Interval):
+            result = self.restrict(other.lo, other.hi)
+        elif isinstance(other, Domain):
+            # align the bits at the smaller offset
+            offset = min(self.offset, other.offset)
+            result = Domain(
+                (self.bits << (self.offset - offset))
+                & (other.bits << (other.offset - offset)),
+                offset,
+            )
+        else:
+            return None
+        return result if result.bits else None
+
+    def __iter__(self) -> typing.Iterator[int]:
+        bits = self.bits
+        offset = self.offset
+        while bits:
+            low = bits & -bits
+            yield offset + low.bit_length() - 1
+            bits ^= low
+
+    def __len__(self):
+        return self.bits.bit_count()
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def __contains__(self, value):
+        return self.check(value)
+
+    def _is_interval(self) -> bool:
+        # the lowest bit is set, so the values are consecutive if adding one carries through all the bits
+        return self.bits & (self.bits + 1) == 0
+
+    def __eq__(self, other):
+        if isinstance(other, Interval):
+            return (
+                bool(self)
+                and self._is_interval()
+                and (self.min, self.max) == (other.lo, other.hi)
+            )
+        if not isinstance(other, Domain):
+            return NotImplemented
+        return self.bits == other.bits and self.offset == other.offset
+
+    def __hash__(self):
+        # equal to the hash of the interval with the same values
+        if self.bits and self._is_interval():
+            return hash((self.min, self.max))
+        return hash((self.bits, self.offset))
+
+    def __repr__(self):
+        return f"Domain({set(self)!r})"
+
+
+class Interval(Constraint):
+    """Integers between lo and hi inclusive. Like a Domain, it can be revised by relations, and it stays an
+    interval unless a value strictly between its bounds is removed."""
+
+    __slots__ = ("lo", "hi")
+
+    def __init__(self, lo: int, hi: int):
+        self.lo = lo
+        self.hi = hi
+
+    def as_domain(self) -> Domain:
+        return Domain.interval(self.lo, self.hi)
+
+    @property
+    def min(self) -> int:
+        return self.lo
+
+    @property
+    def max(self) -> int:
+        return self.hi
+
+    def restrict(self, lo: int, hi: int) -> "Interval":
+        """Return the values of this interval between lo and hi inclusive."""
+        return Interval(max(lo, self.lo), min(hi, self.hi))
+
+    def discard(self, value: int) -> Constraint:
+        """Return this interval without value, which is a Domain if value is strictly between the bounds."""
+        if value == self.lo:
+            return Interval(self.lo + 1, self.hi)
+        if value == self.hi:
+            return Interval(self.lo, self.hi - 1)
+        if self.lo < value < self.hi:
+            return self.as_domain().discard(value)
+        return self
+
+    def check(self, value: Term) -> bool:
+        return type(value) is int and self.lo <= value <= self.hi
+
+    def combine(self, other: Constraint) -> typing.Optional[Constraint]:
+        if isinstance(other, Domain):
+            return other.combine(self)
+        if not isinstance(other, Interval):
+            return None
+        result = self.restrict(other.lo, other.hi)
+        return result if result else None
+
+    def __iter__(self) -> typing.Iterator[int]:
+        return iter(range(self.lo, self.hi + 1))
+
+    def __len__(self):
+        return max(self.hi - self.lo + 1, 0)
+
+    def __bool__(self):
+        return self.lo <= self.hi
+
+    def __contains__(self, value):
+        return self.check(value)
+
+    def __eq__(self, other):
+        if isinstance(other, Domain):
+            return other == self
+        if not isinstance(other, Interval):
+            return NotImplemented
+        return (self.lo, self.hi) == (other.lo, other.hi)
+
+    def __hash__(self):
+        return hash((self.lo, self.hi))
+
+    def __repr__(self):
+        return f"Interval({self.lo}, {self.hi})"
+
+
+class Relation(ABC):
+    """Binary constraint between the terms x and y. Relations revise domains, which are Domains or Intervals."""
+
+    __slots__ = ("x", "y")
+
+    def __init__(self, x: Term, y: Term):
+        self.x = x
+        self.y = y
+
+    @abstractmethod
+    def revise(self, dx: Domain, dy: Domain) -> Domain:
+        """Return the values of dx that are related to some value of dy."""
+
+    @abstractmethod
+    def converse(self) -> "Relation":
+        """Return the same constraint, seen from y."""
+
+
+class Satisfies(Relation):
+    """x and y satisfy predicate(x, y). Revising checks pairs of values, so prefer a specialized relation."""
+
+    __slots__ = ("predicate",)
+
+    def __init__(self, x: Term, y: Term, predicate: typing.Callable[[int, int], bool]):
+        super().__init__(x, y)
+        self.predicate = predicate
+
+    def revise(self, dx: Domain, dy: Domain) -> Domain:
+        predicate = self.predicate
+        return Domain.of(a for a in dx if any(predicate(a, b) for b in dy))
+
+    def converse(self) -> Relation:
+        predicate = self.predicate
+        return Satisfies(self.y, self.x, lambda b, a: predicate(a, b))
+
+
+class NotEqual(Relation):
+    """x != y"""
+
+    __slots__ = ()
+
+    def revise(self, dx: Domain, dy: Domain) -> Domain:
+        if dy.min != dy.max:
+            return dx
+        return dx.discard(dy.min)
+
+    def converse(self) -> Relation:
+        return NotEqual(self.y, self.x)
+
+
+class Before(Relation):
+    """x + gap <= y, for example a task x of duration gap that must finish before y starts."""
+
+    __slots__ = ("gap",)
+
+    def __init__(self, x: Term, y: Term, gap: int = 0):
+        super().__init__(x, y)
+        self.gap = gap
+
+    def revise(self, dx: Domain, dy: Domain) -> Domain:
+        return dx.restrict(dx.min, dy.max - self.gap)
+
+    def converse(self) -> Relation:
+        return After(self.y, self.x, self.gap)
+
+
+class After(Relation):
+    """x >= y + gap"""
+
+    __slots__ = ("gap",)
+
+    def __init__(self, x: Term, y: Term, gap: int = 0):
+        super().__init__(x, y)
+        self.gap = gap
+
+    def revise(self, dx: Domain, dy: Domain) -> Domain:
+        return dx.restrict(dy.min + self.gap, dx.max)
+
+    def converse(self) -> Relation:
+        return Before(self.y, self.x, self.gap)
+
+
+def domain(x: Term, s: Substitution) -> typing.Optional[typing.Union[Domain, Interval]]:
+    """Return the values x may take in s, or None if x is not restricted to a finite domain. Intervals are
+    returned as they are, so that relations that only look at the bounds never materialize their values.
+    """
+    x = walk(x, s)
+    if isinstance(x, Var):
+        c = s.attributes.get(x) if isinstance(s, ConstraintStore) else None
+        return c if isinstance(c, (Domain, Interval)) else None
+    if type(x) is int:
+        return Domain(1, x)
+    return Domain(0)
+
+
+def ac3(
+    relations: typing.Iterable[Relation], s: Substitution
+) -> typing.Optional[ConstraintStore]:
+    """Prune the domains of the variables in relations until they are arc consistent, and return the new store.
+    Variables whose domain shrinks to a single value are bound to it. If a domain becomes empty, return None.
+
+    Relations involving a variable without a finite domain are ignored.
+    """
+    domains = {}
+    forward = []
+    backward = []
+    for relation in relations:
+        for arcs, arc in ((forward, relation), (backward, relation.converse())):
+            x, y = walk(arc.x, s), walk(arc.y, s)
+            for v in (x, y):
+                if v not in domains:
+                    domains[v] = domain(v, s)
+            if domains[x] is not None and domains[y] is not None:
+                arcs.append((x, y, arc))
+
+    # Relations often form chains, such as tasks that follow each other. Changes travel along a chain in a single
+    # pass only if arcs are revised in the chain's direction, so the queue starts with two passes over all arcs in
+    # opposite orders. The second pass finds nothing to do if the first went the right way.
+    queue = deque(reversed(forward))
+    queue.extend(backward)
+    queue.extend(forward)
+    queue.extend(reversed(backward))
+
+    # arcs to revise again when the domain of a term changes
+    watchers = {}
+    for arc in forward + backward:
+        watchers.setdefault(arc[1], []).append(arc)
+
+    queued = set(map(id, queue))
+    changed = set()
+    while queue:
+        arc = queue.popleft()
+        queued.discard(id(arc))
+        x, y, relation = arc
+        dx = domains[x]
+        revised = relation.revise(dx, domains[y])
+        if revised == dx:
+            continue
+        if not revised:
+            return None
+        domains[x] = revised
+        changed.add(x)
+        for other in watchers.get(x, ()):
+            if other[0] is not y and id(other) not in queued:
+                queue.append(other)
+                queued.add(id(other))
+
+    return _store_domains(domains, changed, s)
+
+
+def _store_domains(
+    domains: typing.Dict, changed: typing.Set, s: Substitution
+) -> ConstraintStore:
+    """Store the changed domains in s, and bind variables whose domain has a single value."""
+    if not isinstance(s, ConstraintStore):
+        s = ConstraintStore(s)
+    substitution = s.substitution
+    attributes = s.attributes
+    for x, d in domains.items():
+        if d is None or not isinstance(x, Var):
+            continue
+        if len(d) == 1:
+            substitution = extend_dispatch(substitution, x, d.min)
+            attributes = attributes.delete(x)
+        elif x in changed:
+            # unchanged constraints stay as they are, so intervals are not replaced by their values
+            attributes = attributes.set(x, d)
+    return ConstraintStore(substitution, attributes)
+
+
+def solve(
+    variables: typing.Sequence[Var],
+    relations: typing.Sequence[Relation],
+    s: Substitution,
+) -> typing.Iterator[ConstraintStore]:
+    """Produce every store in which all variables are bound to values of their domains that satisfy relations.
+
+    Domains are pruned with ac3 before each choice, and the variable with the fewest remaining values is bound
+    first. Every variable must have a finite domain.
+    """
+    stack = [s]
+    while stack:
+        s = ac3(relations, stack.pop())
+        if s is None:
+            continue
+
+        best = None
+        for x in variables:
+            d = domain(x, s)
+            if d is None:
+                raise ValueError(f"{walk(x, s)} has no finite domain")
+            if len(d) > 1 and (best is None or len(d) < len(best[1])):
+                best = walk(x, s), d
+        if best is None:
+            yield s
+            continue
+
+        x, d = best
+        for value in reversed(list(d)):
+            result = try_unify(x, value, s)
+            if result is not None:
+                stack.append(result)
+
+
+def labeling(variables: typing.Sequence[Var], relations: typing.Sequence[Relation]):
+    """Goal that succeeds for every solution of relations, as found by solve."""
+
+    def goal(s):
+        return solve(variables, relations, s)
+
+    return goal
@@ -0,0 +1,173 @@
+"""Lazy miniKanren-style goals on top of the unification engine.
+
+A goal is a function that takes a substitution and returns a stream of substitutions, one for each way in which
+the goal can be satisfied. Streams are generators, so answers are only computed when they are asked for.
+
+Besides substitutions, streams may yield None. It marks a pause in which the stream did some work but has no
+answer yet, and hands control back to whoever consumes the stream. disj and conj use the pauses to interleave
+their streams fairly, so a stream that searches forever without an answer cannot starve the others:
+
+    def nat(x):
+        return conde([eq(x, 0)], [fresh(lambda y: conj(eq(x, Succ(y)), nat(y)))])
+
+    run(3, q, nat(q))  # [0, Succ(0), Succ(Succ(0))]
+
+Goals built with eq, conj, disj and fresh are not generator functions themselves. A single loop takes them apart
+and keeps the pending work in a queue, so relations may recurse to any depth without growing the Python stack.
+"""
+
+from collections import deque
+from itertools import islice
+import typing
+
+from core import Substitution, Term, try_unify, walk_star
+from hamt import Hamt
+from variable import Var
+
+Stream = typing.Iterator[typing.Optional[Substitution]]
+Goal = typing.Callable[[Substitution], Stream]
+
+
+class _Goal:
+    """Goal built from eq, conj, disj and fresh. Calling it runs _search, which takes such goals apart itself
+    instead of calling them, so recursive relations do not nest Python frames."""
+
+    __slots__ = ()
+
+    def __call__(self, s: Substitution) -> Stream:
+        return _search(self, s)
+
+
+class _Eq(_Goal):
+    __slots__ = ("u", "v")
+
+    def __init__(self, u: Term, v: Term):
+        self.u = u
+        self.v = v
+
+
+class _Conj(_Goal):
+    __slots__ = ("goals",)
+
+    def __init__(self, goals: typing.Tuple[Goal, ...]):
+        self.goals = goals
+
+
+class _Disj(_Goal):
+    __slots__ = ("goals",)
+
+    def __init__(self, goals: typing.Tuple[Goal, ...]):
+        self.goals = goals
+
+
+class _Fresh(_Goal):
+    __slots__ = ("f", "n")
+
+    def __init__(self, f: typing.Callable[..., Goal]):
+        self.f = f
+        self.n = f.__code__.co_argcount
+
+
+def eq(u: Term, v: Term) -> Goal:
+    """Goal that succeeds once if u and v unify."""
+    return _Eq(u, v)
+
+
+# goal that always succeeds once
+succeed = _Conj(())
+
+# goal that never succeeds
+fail = _Disj(())
+
+
+def disj(*goals: Goal) -> Goal:
+    """Goal that succeeds for every way in which any of the goals succeeds."""
+    return _Disj(goals)
+
+
+def conj(*goals: Goal) -> Goal:
+    """Goal that succeeds for every way in which all of the goals succeed together."""
+    return _Conj(goals)
+
+
+def conde(*clauses: typing.Sequence[Goal]) -> Goal:
+    """Goal that succeeds if all goals of any clause succeed."""
+    return disj(*(conj(*clause) for clause in clauses))
+
+
+def fresh(f: typing.Callable[..., Goal]) -> Goal:
+    """Goal that calls f with a new variable for each of its parameters and pursues the goal it returns.
+
+    f is only called when the goal is pursued, after a pause, so goals may refer to themselves recursively.
+    """
+    return _Fresh(f)
+
+
+def solutions(
+    query: Term, *goals: Goal, s: typing.Optional[Substitution] = None
+) -> typing.Iterator[Term]:
+    """Lazily produce the query term, resolved in every substitution in which all goals succeed."""
+    stream = conj(*goals)(Hamt() if s is None else s)
+    for s in stream:
+        if s is not None:
+            yield walk_star(query, s)
+
+
+def run(
+    n: typing.Optional[int],
+    query: Term,
+    *goals: Goal,
+    s: typing.Optional[Substitution] = None,
+) -> typing.List[Term]:
+    """Return up to n resolved query terms for which all goals succeed. If n is None, return all of them."""
+    return list(islice(solutions(query, *goals, s=s), n))
+
+
+def _search(goal: Goal, s: Substitution) -> Stream:
+    """Produce the stream of goal in s from a single loop.
+
+    The search is a queue of threads, each a substitution with the goals still to be pursued in it, as a linked
+    list of (goal, rest) pairs. A thread runs until it finds an answer, fails, or reaches a disj, which replaces
+    it with one thread per branch, or a fresh, which pauses it. Goals of other kinds are called, and their
+    streams take turns with the threads, each answer starting a thread with the remaining goals.
+    """
+    # threads are (substitution, goals, stream), where stream is None unless the thread waits for a goal's stream
+    threads = deque([(s, (goal, None), None)])
+    while threads:
+        s, goals, stream = threads.popleft()
+        if stream is not None:
+            try:
+                t = next(stream)
+            except StopIteration:
+                continue
+            threads.append((s, goals, stream))
+            if t is None:
+                yield None
+            else:
+                threads.append((t, goals, None))
+            continue
+
+        while goals is not None:
+            goal, goals = goals
+            kind = type(goal)
+            if kind is _Eq:
+                s = try_unify(goal.u, goal.v, s)
+                if s is None:
+                    break
+            elif kind is _Conj:
+                for g in reversed(goal.goals):
+                    goals = (g, goals)
+            elif kind is _Disj:
+                for g in goal.goals:
+                    threads.append((s, (g, goals), None))
+                break
+            elif kind is _Fresh:
+                body = goal.f(*(Var() for _ in range(goal.n)))
+                threads.append((s, (body, goals), None))
+                yield None
+                break
+            else:
+                threads.append((s, goals, iter(goal(s))))
+                break
+        else:
+            yield s
@@ -0,0 +1,242 @@
+"""Persistent hash array mapped trie.
+
+Hamt is an immutable mapping with structural sharing. Extending it with a new association copies only the
+O(log n) nodes on the path to the new entry, so it can be used as a substitution that grows by one binding at a
+time without the quadratic cost of copying a dict on every extension. Old versions remain valid, which makes
+snapshots free.
+
+Hamt supports `s | {x: v}`, so it can be passed to unify, walk, walk_star and occurs wherever a dict is accepted.
+"""
+
+from collections.abc import Mapping
+
+BITS = 5
+WIDTH = 1 << BITS
+MASK = WIDTH - 1
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+
+_missing = object()
+
+
+class Hamt(Mapping):
+    """Immutable mapping with O(log n) lookup and extension."""
+
+    __slots__ = ("_root", "_len")
+
+    def __init__(self, items=()):
+        self._root = _EMPTY
+        self._len = 0
+        if items:
+            if isinstance(items, Mapping):
+                items = items.items()
+            root, n = self._root, 0
+            for k, v in items:
+                root, added = root.set(0, _hash(k), k, v)
+                n += added
+            self._root, self._len = root, n
+
+    @classmethod
+    def _make(cls, root, length):
+        self = cls.__new__(cls)
+        self._root = root
+        self._len = length
+        return self
+
+    def set(self, key, value) -> "Hamt":
+        """Return a new mapping that additionally associates key with value."""
+        root, added = self._root.set(0, _hash(key), key, value)
+        return Hamt._make(root, self._len + added)
+
+    def delete(self, key) -> "Hamt":
+        """Return a new mapping without key. Raise KeyError if key is not present."""
+        root = self._root.delete(0, _hash(key), key)
+        if root is None:
+            root = _EMPTY
+        return Hamt._make(root, self._len - 1)
+
+    def get(self, key, default=None):
+        value = self._root.get(0, _hash(key), key)
+        return default if value is _missing else value
+
+    def __getitem__(self, key):
+        value = self._root.get(0, _hash(key), key)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        try:
+            return self._root.get(0, _hash(key), key) is not _missing
+        except TypeError:
+            return False
+
+    def __iter__(self):
+        for k, _ in self._root.items():
+            yield k
+
+    def items(self):
+        return self._root.items()
+
+    def __len__(self):
+        return self._len
+
+    def __or__(self, other):
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        root, n = self._root, self._len
+        for k, v in other.items():
+            root, added = root.set(0, _hash(k), k, v)
+            n += added
+        return Hamt._make(root, n)
+
+    def __repr__(self):
+        return f"Hamt({dict(self.items())!r})"
+
+
+def _hash(key) -> int:
+    return hash(key) & HASH_MASK
+
+
+class _BitmapNode:
+    """Interior node. Each entry is either a (hash, key, value) tuple or a child node."""
+
+    __slots__ = ("bitmap", "entries")
+
+    def __init__(self, bitmap, entries):
+        self.bitmap = bitmap
+        self.entries = entries
+
+    def get(self, shift, h, key):
+        bit = 1 << ((h >> shift) & MASK)
+        if not self.bitmap & bit:
+            return _missing
+        entry = self.entries[(self.bitmap & (bit - 1)).bit_count()]
+        if type(entry) is tuple:
+            if entry[1] is key or (entry[0] == h and entry[1] == key):
+                return entry[2]
+            return _missing
+        return entry.get(shift + BITS, h, key)
+
+    def set(self, shift, h, key, value):
+        bit = 1 << ((h >> shift) & MASK)
+        idx = (self.bitmap & (bit - 1)).bit_count()
+        entries = self.entries
+
+        if not self.bitmap & bit:
+            new = entries[:idx] + ((h, key, value),) + entries[idx:]
+            return _BitmapNode(self.bitmap | bit, new), True
+
+        entry = entries[idx]
+        if type(entry) is tuple:
+            if entry[1] is key or (entry[0] == h and entry[1] == key):
+                if entry[2] is value:
+                    return self, False
+                child, added = (h, key, value), False
+            else:
+                child, added = _merge(shift + BITS, entry, (h, key, value)), True
+        else:
+            child, added = entry.set(shift + BITS, h, key, value)
+            if child is entry:
+                return self, False
+
+        return (
+            _BitmapNode(self.bitmap, entries[:idx] + (child,) + entries[idx + 1 :]),
+            added,
+        )
+
+    def delete(self, shift, h, key):
+        bit = 1 << ((h >> shift) & MASK)
+        if not self.bitmap & bit:
+            raise KeyError(key)
+        idx = (self.bitmap & (bit - 1)).bit_count()
+        entries = self.entries
+        entry = entries[idx]
+
+        if type(entry) is tuple:
+            if not (entry[1] is key or (entry[0] == h and entry[1] == key)):
+                raise KeyError(key)
+            child = None
+        else:
+            child = entry.delete(shift + BITS, h, key)
+            if (
+                child is not None
+                and len(child.entries) == 1
+                and type(child.entries[0]) is tuple
+            ):
+                # pull a lone leaf up so that lookups stay short
+                child = child.entries[0]
+
+        if child is None:
+            if len(entries) == 1:
+                return None
+            return _BitmapNode(self.bitmap & ~bit, entries[:idx] + entries[idx + 1 :])
+        return _BitmapNode(self.bitmap, entries[:idx] + (child,) + entries[idx + 1 :])
+
+    def items(self):
+        for entry in self.entries:
+            if type(entry) is tuple:
+                yield entry[1], entry[2]
+            else:
+                yield from entry.items()
+
+
+class _CollisionNode:
+    """Leaf node holding entries whose full hashes collide."""
+
+    __slots__ = ("hash", "entries")
+
+    def __init__(self, h, entries):
+        self.hash = h
+        self.entries = entries
+
+    def _find(self, key):
+        for i, entry in enumerate(self.entries):
+            if entry[1] is key or entry[1] == key:
+                return i
+        return -1
+
+    def get(self, shift, h, key):
+        if h != self.hash:
+            return _missing
+        i = self._find(key)
+        return _missing if i < 0 else self.entries[i][2]
+
+    def set(self, shift, h, key, value):
+        i = self._find(key)
+        if i < 0:
+            return _CollisionNode(h, self.entries + ((h, key, value),)), True
+        if self.entries[i][2] is value:
+            return self, False
+        return (
+            _CollisionNode(
+                h, self.entries[:i] + ((h, key, value),) + self.entries[i + 1 :]
+            ),
+            False,
+        )
+
+    def delete(self, shift, h, key):
+        i = self._find(key) if h == self.hash else -1
+        if i < 0:
+            raise KeyError(key)
+        return _CollisionNode(h, self.entries[:i] + self.entries[i + 1 :])
+
+    def items(self):
+        for entry in self.entries:
+            yield entry[1], entry[2]
+
+
+def _merge(shift, a, b):
+    """Create a subtree that contains the two leaf entries a and b."""
+    if shift >= HASH_BITS:
+        return _CollisionNode(a[0], (a, b))
+    ia = (a[0] >> shift) & MASK
+    ib = (b[0] >> shift) & MASK
+    if ia == ib:
+        return _BitmapNode(1 << ia, (_merge(shift + BITS, a, b),))
+    if ia < ib:
+        return _BitmapNode((1 << ia) | (1 << ib), (a, b))
+    return _BitmapNode((1 << ia) | (1 << ib), (b, a))
+
+
+_EMPTY = _BitmapNode(0, ())
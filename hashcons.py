@@ -0,0 +1,137 @@
+"""Hash-consed structures.
+
+Interned structures are shared: constructing a structure that is equal to an existing one returns the existing
+object. Equality is therefore an identity check, and every instance carries its precomputed hash, the frozen set
+of variables it contains and a flag telling whether it is ground. The engine uses the variable set to skip
+ground subterms in the occurs check and in walk_star.
+
+Subclasses name their fields, which become read-only attributes:
+
+    class Pair(Interned):
+        __slots__ = ()
+        fields = ("car", "cdr")
+
+Instances are held in a weak-valued table, so structures that are no longer used elsewhere are collected.
+Children must be hashable.
+"""
+
+import typing
+import weakref
+
+from core import (
+    Substitution,
+    children_dispatch,
+    occurs,
+    variables_dispatch,
+    walk_dispatch,
+    walk_star,
+)
+from structure import Structure
+from variable import Var
+
+_table = weakref.WeakValueDictionary()
+
+_NO_VARIABLES = frozenset()
+
+
+class Interned(Structure):
+    __slots__ = ("_args", "_hash", "variables", "__weakref__")
+
+    fields: typing.Tuple[str, ...] = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for i, name in enumerate(cls.fields):
+            setattr(cls, name, property(lambda self, i=i: self._args[i]))
+
+    def __new__(cls, *args):
+        if len(args) != len(cls.fields):
+            raise TypeError(
+                f"{cls.__name__} takes {len(cls.fields)} arguments but {len(args)} were given"
+            )
+
+        # the types distinguish arguments that are equal but not identical, such as 1 and True, also
+        # when they are nested in tuples or other structures
+        key = (cls, args, tuple(map(_type_key, args)))
+        try:
+            return _table[key]
+        except KeyError:
+            pass
+
+        self = super().__new__(cls)
+        self._args = args
+        self._hash = hash(key)
+        self.variables = _collect_variables(args)
+        _table[key] = self
+        return self
+
+    @property
+    def is_ground(self) -> bool:
+        return self.variables is not None and not self.variables
+
+    def children(self):
+        return self._args
+
+    def rebuild(self, children):
+        return type(self)(*children)
+
+    def occurs(self, x, s: Substitution) -> bool:
+        return any(occurs(x, a, s) for a in self._args)
+
+    def unify(self, other, s: Substitution) -> Substitution:
+        # equal structures are identical, and the engine unifies the children of
+        # structures of the same type, so anything else fails
+        return None
+
+    def walk_star(self, s: Substitution) -> "Interned":
+        return walk_star(self, s)
+
+    def __eq__(self, other):
+        return self is other
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        return type(self), self._args
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(map(repr, self._args))})"
+
+
+def _type_key(a):
+    """Return the type of a, together with the type keys of its children if it is a compound term."""
+    if isinstance(a, Interned):
+        # equal interned structures are identical, so their type is enough
+        return type(a)
+    kids = children_dispatch(a)
+    if kids is None:
+        return type(a)
+    return type(a), tuple(map(_type_key, kids))
+
+
+def _collect_variables(args) -> typing.Optional[typing.FrozenSet[Var]]:
+    """Return the variables in args, or None if some of them are hidden in opaque terms."""
+    found = set()
+    todo = list(args)
+    while todo:
+        t = todo.pop()
+        if isinstance(t, Var):
+            found.add(t)
+            continue
+        if isinstance(t, Interned):
+            if t.variables is None:
+                return None
+            found.update(t.variables)
+            continue
+        kids = children_dispatch(t)
+        if kids is not None:
+            todo.extend(kids)
+        elif walk_dispatch.dispatch(type(t)) is not walk_dispatch.dispatch(object):
+            return None
+    return frozenset(found) if found else _NO_VARIABLES
+
+
+@variables_dispatch.register
+def interned_variables(v: Interned):
+    return v.variables
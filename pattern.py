@@ -0,0 +1,129 @@
+"""Pattern compiler.
+
+compile_pattern turns a pattern into a function that matches terms against it, with the same result as
+core.match:
+
+    head = compile_pattern(F(x, G(1, y)))
+    s = head(term, s)  # None if term does not match
+
+The function is generated Python code specialized for the shape of the pattern. Type tests, access to children,
+comparisons with constants and bindings of variables are spelled out, so no handlers are dispatched for the
+parts of the pattern that expose their children, are variables or are built-in constants. Other parts of the
+pattern are passed to core.match.
+
+Generated code depends only on the pattern's variant key, in which variables are numbered by first occurrence.
+Patterns that differ only in their variables share the code, which is cached.
+"""
+
+import functools
+import typing
+
+from core import (
+    Failure,
+    Substitution,
+    Term,
+    _equal,
+    children_dispatch,
+    extend_dispatch,
+    match,
+)
+from hashcons import Interned
+from variant import CONSTANT, OTHER, VARIABLE, variant_key
+
+Matcher = typing.Callable[[Term, Substitution], typing.Optional[Substitution]]
+
+_missing = object()
+
+
+def compile_pattern(pattern: Term) -> Matcher:
+    """Return a function that matches terms against pattern, like `match(pattern, term, s)`."""
+    key, variables = variant_key(pattern)
+    try:
+        factory = _cached_factory(key)
+    except TypeError:
+        # some constant is not hashable
+        factory = _factory(key)
+    return factory(*variables)
+
+
+def _factory(key: typing.Tuple) -> typing.Callable[..., Matcher]:
+    """Generate a function that takes the variables of a pattern with the given variant key and returns a
+    matcher for the pattern."""
+    namespace = {
+        "Failure": Failure,
+        "_equal": _equal,
+        "_missing": _missing,
+        "children_dispatch": children_dispatch,
+        "extend_dispatch": extend_dispatch,
+        "match": match,
+    }
+    body = ["extend = extend_dispatch.dispatch(type(s))"]
+    parameters = []
+    # names of the subterms of the term that still have to be matched, the next one last
+    pending = ["t0"]
+    count = 1
+
+    for i, part in enumerate(key):
+        t = pending.pop()
+        kind = part[0]
+        if kind == VARIABLE:
+            number = part[1]
+            x = f"x{number}"
+            if number == len(parameters):
+                v = f"v{number}"
+                parameters.append(v)
+                body += [
+                    f"{x} = s.get({v}, _missing)",
+                    f"if {x} is _missing:",
+                    f"    s = extend(s, {v}, {t})",
+                    "    if type(s) is Failure: return None",
+                    f"    {x} = {t}",
+                    f"elif not _equal({x}, {t}):",
+                    "    return None",
+                ]
+            else:
+                body.append(f"if {x} is not {t} and not _equal({x}, {t}): return None")
+            continue
+
+        constant = f"k{i}"
+        if kind == CONSTANT:
+            namespace[constant] = part[2]
+            body.append(f"if {t} != {constant}: return None")
+        elif kind == OTHER:
+            namespace[constant] = part[2]
+            body += [
+                f"s = match({constant}, {t}, s)",
+                "if s is None: return None",
+            ]
+        else:
+            _, typ, n = part
+            namespace[constant] = typ
+            kids = [f"t{count + j}" for j in range(n)]
+            count += n
+            body.append(f"if type({t}) is not {constant}: return None")
+            if issubclass(typ, Interned):
+                children = f"{t}._args"
+            else:
+                children = f"c{i}"
+                body += [
+                    f"{children} = children_dispatch({t})",
+                    f"if {children} is None or len({children}) != {n}: return None",
+                ]
+            if kids:
+                body.append(f"{', '.join(kids)}, = {children}")
+            pending.extend(reversed(kids))
+
+    body.append("return s")
+    source = "\n".join(
+        [
+            f"def factory({', '.join(parameters)}):",
+            "    def matcher(t0, s):",
+            *(f"        {line}" for line in body),
+            "    return matcher",
+        ]
+    )
+    exec(compile(source, "<pattern>", "exec"), namespace)
+    return namespace["factory"]
+
+
+_cached_factory = functools.lru_cache(maxsize=1024)(_factory)
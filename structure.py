@@ -1,8 +1,24 @@
-from abc import ABC, abstractmethod
-from core import Substitution, occurs_dispatch, unify_dispatch, walk_dispatch
+from abc import ABC, ABCMeta, abstractmethod
+import typing
+from core import (
+    Substitution,
+    Term,
+    _equal_pairs,
+    children_dispatch,
+    match_dispatch,
+    occurs,
+    occurs_dispatch,
+    rebuild_dispatch,
+    unify_dispatch,
+    unify_pairs,
+    walk_dispatch,
+    walk_star,
+)
 
 
 class Structure(ABC):
+    __slots__ = ()
+
     @abstractmethod
     def occurs(self, x: "Structure", s: Substitution) -> bool:
         """Test if x occurs in this structure."""
@@ -15,12 +31,137 @@ class Structure(ABC):
     def walk_star(self, s: Substitution) -> "Structure":
         pass
 
+    def match(self, term: Term, s: Substitution) -> typing.Optional[Substitution]:
+        """Match this structure, as a pattern, against term. Only variables in this structure may be bound.
+        Return None if it does not match. By default, this matches terms equal to it, so structures that hide
+        their children must override this to bind their variables."""
+        return s if self == term else None
+
+    def children(self) -> typing.Optional[typing.Sequence[Term]]:
+        """Return the subterms of this structure, or None to keep them opaque.
+        Structures that expose their children are traversed by the engine without calling occurs, unify or
+        walk_star, so they can be arbitrarily deep. Two such structures unify if they have the same type and
+        their children unify pairwise."""
+        return None
+
+    def rebuild(self, children: typing.Sequence[Term]) -> "Structure":
+        """Create a structure like this one, but with the given children."""
+        raise TypeError(f"cannot rebuild {type(self).__name__} from children")
+
+
+def structure(cls: type) -> type:
+    """Class decorator that turns a class with annotated fields into a slotted Structure:
+
+        @structure
+        class Pair:
+            car: Term
+            cdr: Term
+
+    The fields become the structure's children. __init__, occurs, unify, walk_star, children, rebuild, __eq__,
+    __hash__ and __repr__ are generated for the fields, unless the class defines them itself. Like unify, the
+    generated __eq__ and __hash__ handle arbitrarily deep structures.
+    """
+    fields = tuple(cls.__dict__.get("__annotations__", {}))
+    for name in fields:
+        if name in cls.__dict__:
+            raise TypeError(f"field {name} of structure {cls.__name__} has a default")
+
+    namespace = {
+        k: v for k, v in cls.__dict__.items() if k not in ("__dict__", "__weakref__")
+    }
+    namespace["__slots__"] = fields
+    namespace.setdefault("__match_args__", fields)
+    namespace.setdefault("__hash__", _hash_structure)
+    for name, method in _structure_methods(cls.__name__, fields).items():
+        namespace.setdefault(name, method)
+
+    if issubclass(cls, Structure):
+        bases = cls.__bases__
+    elif cls.__bases__ == (object,):
+        bases = (Structure,)
+    else:
+        bases = cls.__bases__ + (Structure,)
+    return ABCMeta(cls.__name__, bases, namespace)
+
+
+def _structure_methods(
+    name: str, fields: typing.Tuple[str, ...]
+) -> typing.Dict[str, typing.Callable]:
+    """Generate the methods of a structure with the given fields."""
+    values = [f"self.{f}" for f in fields]
+    pairs = [f"({v}, other.{f})" for v, f in zip(values, fields)]
+    # trailing commas keep tuples of one field tuples
+    children = "".join(f"{v}, " for v in values)
+    assignments = "; ".join(f"self.{f} = {f}" for f in fields) or "pass"
+    occurrences = " or ".join(f"_occurs(x, {v}, s)" for v in values) or "False"
+    representation = ", ".join(f"{{{v}!r}}" for v in values)
+
+    source = f"""
+def __init__(self, {", ".join(fields)}):
+    {assignments}
+
+def children(self):
+    return ({children})
+
+def rebuild(self, children):
+    return type(self)(*children)
+
+def occurs(self, x, s):
+    return {occurrences}
+
+def unify(self, other, s):
+    if type(other) is not type(self):
+        return None
+    return _unify_pairs([{", ".join(pairs)}], s)
+
+def walk_star(self, s):
+    return _walk_star(self, s)
+
+def __eq__(self, other):
+    if other.__class__ is not self.__class__:
+        return NotImplemented
+    return _equal_pairs([{", ".join(pairs)}])
+
+def __repr__(self):
+    return f"{name}({representation})"
+"""
+    helpers = {
+        "_equal_pairs": _equal_pairs,
+        "_occurs": occurs,
+        "_unify_pairs": unify_pairs,
+        "_walk_star": walk_star,
+    }
+    methods = {}
+    exec(compile(source, f"<structure {name}>", "exec"), helpers, methods)
+    return methods
+
+
+def _hash_structure(root: Structure) -> int:
+    """Hash a structure from its type and fields, visiting the fields that are structures hashed the same way
+    without recursion."""
+    parts = []
+    stack = [root]
+    while stack:
+        term = stack.pop()
+        if type(term).__hash__ is _hash_structure:
+            # the type determines the number of fields that follow
+            parts.append(type(term))
+            stack.extend(reversed(term.children()))
+        else:
+            parts.append(term)
+    return hash(tuple(parts))
+
 
 @unify_dispatch.register()
 def unify_structure(u: Structure, v: Structure, s):
     return u.unify(v, s)
 
 
+@match_dispatch.register
+def match_structure(p: Structure, t, s):
+    return p.match(t, s)
+
+
 @occurs_dispatch.register
 def occurs_structure(v: Structure, x, s):
     return v.occurs(x, s)
@@ -29,3 +170,13 @@ def occurs_structure(v: Structure, x, s):
 @walk_dispatch.register
 def walk_structure(v: Structure, s):
     return v.walk_star(s)
+
+
+@children_dispatch.register
+def structure_children(v: Structure):
+    return v.children()
+
+
+@rebuild_dispatch.register
+def rebuild_structure(v: Structure, children):
+    return v.rebuild(children)
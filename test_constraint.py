@@ -0,0 +1,125 @@
+import pytest
+
+from constraint import Constraint, ConstraintStore
+from core import Mismatch, compact, try_unify, unify, unify_all, walk_star
+from goals import conj, eq, run
+from unionfind import UnionFind
+from variable import Var
+
+
+class Range(Constraint):
+    def __init__(self, lo, hi):
+        self.lo = lo
+        self.hi = hi
+
+    def check(self, value):
+        return self.lo <= value <= self.hi
+
+    def combine(self, other):
+        lo, hi = max(self.lo, other.lo), min(self.hi, other.hi)
+        if lo > hi:
+            return None
+        return Range(lo, hi)
+
+    def __repr__(self):
+        return f"Range({self.lo}, {self.hi})"
+
+
+class Counting(Range):
+    checks = 0
+
+    def check(self, value):
+        Counting.checks += 1
+        return super().check(value)
+
+
+def test_constraint_checks_values():
+    assert unify(Range(0, 10), 5, {}) == {}
+    assert try_unify(11, Range(0, 10), {}) is None
+
+
+def test_constraint_attaches_to_variable():
+    x = Var()
+    s = unify(x, Range(0, 10), {})
+    assert isinstance(s, ConstraintStore)
+    assert (s.constraint(x).lo, s.constraint(x).hi) == (0, 10)
+    assert walk_star(x, s) is x
+
+
+def test_constraint_is_checked_when_variable_is_bound():
+    x = Var()
+    s = unify(Range(0, 10), x, ConstraintStore())
+    assert walk_star(x, unify(x, 3, s)) == 3
+    with pytest.raises(Mismatch):
+        unify(x, 30, s)
+
+
+def test_constraints_on_a_variable_are_combined():
+    x = Var()
+    s = unify(x, Range(0, 10), {})
+    s = unify(x, Range(5, 20), s)
+    assert (s.constraint(x).lo, s.constraint(x).hi) == (5, 10)
+    assert try_unify(x, 3, s) is None
+    assert try_unify(x, Range(11, 20), s) is None
+
+
+def test_binding_variables_merges_their_constraints():
+    x, y = Var(), Var()
+    s = unify(x, Range(0, 10), {})
+    s = unify(y, Range(5, 20), s)
+    s = unify(x, y, s)
+    assert (s.constraint(x).lo, s.constraint(x).hi) == (5, 10)
+    assert (s.constraint(y).lo, s.constraint(y).hi) == (5, 10)
+    assert try_unify(y, 4, s) is None
+    assert walk_star(x, unify(y, 7, s)) == 7
+
+
+def test_binding_variables_with_incompatible_constraints_fails():
+    x, y = Var(), Var()
+    s = unify(x, Range(0, 3), {})
+    s = unify(y, Range(5, 20), s)
+    assert try_unify(x, y, s) is None
+
+
+def test_only_constraints_of_bound_variables_are_checked():
+    Counting.checks = 0
+    xs = [Var() for _ in range(100)]
+    s = ConstraintStore()
+    for x in xs:
+        s = unify(x, Counting(0, 10), s)
+    s = unify(xs[0], 1, s)
+    assert Counting.checks == 1
+
+
+def test_constraint_store_wraps_union_find():
+    x, y = Var(), Var()
+    s = unify(x, Range(0, 10), ConstraintStore(UnionFind()))
+    s = unify(x, y, s)
+    m = s.substitution.mark()
+    assert try_unify(y, 11, s) is None
+    s.substitution.undo_to(m)
+    assert walk_star(x, unify(y, 2, s)) == 2
+
+
+def test_unify_all_checks_constraints():
+    x, y = Var(), Var()
+    s = unify_all([(x, Range(0, 10)), (x, y)], ConstraintStore())
+    assert walk_star(x, unify_all([(y, 4)], s)) == 4
+    with pytest.raises(Mismatch):
+        unify_all([(x, Range(0, 10)), (x, y), (y, 40)], ConstraintStore())
+
+
+def test_constraints_in_goals():
+    q = Var()
+    assert run(None, q, conj(eq(q, Range(0, 10)), eq(q, 5))) == [5]
+    assert run(None, q, conj(eq(q, Range(0, 10)), eq(q, 50))) == []
+
+
+def test_compact_keeps_constraints_of_reachable_variables():
+    x, y, z = Var(), Var(), Var()
+    s = unify_all([(x, Range(0, 10)), (z, Range(0, 5)), (y, x)], ConstraintStore())
+    c = compact(s, [y])
+    assert len(c.attributes) == 1
+    assert c.constraint(y).hi == 10
+    assert try_unify(y, 11, c) is None
+    assert walk_star(y, unify(y, 3, c)) == 3
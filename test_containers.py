@@ -0,0 +1,141 @@
+from collections import namedtuple
+from unittest.mock import patch
+
+import pytest
+
+import containers  # noqa: F401
+from core import (
+    NONE,
+    Cycle,
+    Mismatch,
+    match,
+    occurs,
+    occurs_policy,
+    try_unify,
+    unify,
+    variables_dispatch,
+    walk_star,
+)
+from variable import Var
+
+Point = namedtuple("Point", "x y")
+
+
+def test_tuples_unify_element_wise():
+    x, y = Var(), Var()
+    s = unify((x, (2, y)), (1, (2, 3)), {})
+    assert walk_star((x, y), s) == (1, 3)
+
+
+def test_lists_unify_element_wise():
+    x = Var()
+    assert walk_star([x, [x]], unify([x, [x]], [1, [1]], {})) == [1, [1]]
+    assert try_unify([x], (x,), {}) is None
+
+
+@patch("core.unify_dispatch")
+def test_containers_of_different_lengths_fail_before_their_elements(unify_dispatch):
+    unify_dispatch.return_value = None
+    x = Var()
+    assert try_unify((x, 1), (1, 2, 3), {}) is None
+    unify_dispatch.assert_called_once()
+    assert unify_dispatch.call_args.args[:2] == ((x, 1), (1, 2, 3))
+
+
+def test_named_tuples_are_rebuilt_with_their_type():
+    x = Var()
+    p = walk_star(Point(x, 2), {x: 1})
+    assert type(p) is Point and p == Point(1, 2)
+
+
+def test_walk_star_returns_unchanged_containers_as_they_are():
+    x = Var()
+    t = (1, [2, (3, x)], {"a": x})
+    assert walk_star(t, {}) is t
+    s = {x: 4}
+    resolved = walk_star(t, s)
+    assert resolved == (1, [2, (3, 4)], {"a": 4})
+    assert walk_star(t[2], {}) is t[2]
+
+
+def test_deeply_nested_tuples():
+    x = Var()
+    left, right = x, 0
+    for _ in range(20000):
+        left, right = (left,), (right,)
+    s = unify(left, right, {})
+    assert walk_star(x, s) == 0
+    resolved = walk_star(left, s)
+    for _ in range(20000):
+        (resolved,) = resolved
+    assert resolved == 0
+
+
+def test_occurs_check_looks_into_containers():
+    x = Var()
+    assert occurs(x, (1, [2, {"k": x}]), {})
+    with pytest.raises(Cycle):
+        unify(x, [1, x], {})
+
+
+def test_dicts_unify_by_key():
+    x, y = Var(), Var()
+    s = unify({"a": x, "b": 2}, {"b": y, "a": 1}, {})
+    assert walk_star((x, y), s) == (1, 2)
+
+
+def test_dicts_with_different_keys_fail():
+    x = Var()
+    with pytest.raises(Mismatch):
+        unify({"a": x}, {"b": 1}, {})
+    with pytest.raises(Mismatch):
+        unify({"a": x}, {"a": 1, "b": 2}, {})
+
+
+def test_match_containers():
+    x, y = Var(), Var()
+    assert match((x, [y]), (1, [2]), {}) == {x: 1, y: 2}
+    assert match((x, y), (1, 2, 3), {}) is None
+    assert match({"a": x}, {"a": 1}, {}) == {x: 1}
+    assert match({"a": x}, {"b": 1}, {}) is None
+    assert match({"a": x}, (1,), {}) is None
+
+
+def test_tuples_know_their_variables():
+    x = Var()
+    assert variables_dispatch((1, (2, (x,)), "a")) == {x}
+    assert variables_dispatch((1, (2, (3,)))) == frozenset()
+    assert variables_dispatch((1, [x])) is None
+
+
+@patch("core.unify_dispatch")
+def test_ground_tuples_are_compared_as_a_whole(unify_dispatch):
+    unify_dispatch.return_value = None
+    x = Var()
+    ground = tuple(range(100))
+    assert try_unify(((ground, 1), x), ((ground, 2), 1), {}) is None
+    unify_dispatch.assert_called_once()
+    assert unify_dispatch.call_args.args[:2] == ((ground, 1), (ground, 2))
+
+
+def test_deeply_nested_dicts():
+    x, y = Var(), Var()
+    left, right = x, 0
+    for i in range(5000):
+        left, right = {"a": left, i: 1}, {i: y, "a": right}
+    s = unify(left, right, {})
+    assert walk_star((x, y), s) == (0, 1)
+    assert occurs(x, left, {})
+    resolved = walk_star(left, s)
+    for i in range(5000):
+        assert list(resolved) == ["a", 4999 - i]
+        resolved = resolved["a"]
+    assert resolved == 0
+
+
+def test_rational_dicts_unify_without_occurs_check():
+    x, y = Var(), Var()
+    with occurs_policy(NONE):
+        s = unify(x, {"a": x}, {})
+        s = unify(y, {"a": y}, s)
+        assert unify(x, y, s)
@@ -1,6 +1,34 @@
 from unittest.mock import Mock, patch
 import pytest
-from core import extend_substitution, occurs, unify, walk, Cycle, Mismatch
+from core import (
+    check_cycles,
+    children_dispatch,
+    compact,
+    find_keys,
+    occurs_policy,
+    set_occurs_policy,
+    DEFERRED,
+    NONE,
+    extend_substitution,
+    rebuild_dispatch,
+    unify_all,
+    match,
+    match_dispatch,
+    try_unify,
+    Failure,
+    walk_star,
+    walk_star_all,
+    occurs,
+    unify,
+    unify_dispatch,
+    walk,
+    Cycle,
+    Mismatch,
+)
+from constraint import ConstraintStore
+from hamt import Hamt
+from unionfind import UnionFind
+from variable import Var
 
 
 def test_walk_returns_term_if_not_in_substitution():
@@ -68,3 +96,408 @@ def test_extend_substitution_raises_cycle_if_x_occurs_in_v(occurs):
     occurs.return_value = True
     with pytest.raises(Cycle):
         extend_substitution("foo", "bar", {})
+
+
+def test_most_recently_registered_matching_handler_is_used():
+    class A:
+        pass
+
+    @unify_dispatch.register()
+    def first(u: A, v: A, s):
+        return "first"
+
+    @unify_dispatch.register()
+    def second(u: A, v: A, s):
+        return "second"
+
+    assert unify(A(), A(), {}) == "second"
+
+
+def test_registering_a_handler_invalidates_cached_dispatch():
+    class B:
+        pass
+
+    with pytest.raises(Mismatch):
+        unify(B(), B(), {})
+
+    @unify_dispatch.register()
+    def unify_b(u: B, v: B, s):
+        return "unified"
+
+    assert unify(B(), B(), {}) == "unified"
+
+
+def test_custom_predicates_are_evaluated_per_call_in_priority_order():
+    class C:
+        def __init__(self, ok):
+            self.ok = ok
+
+    @unify_dispatch.register()
+    def by_type(u: C, v: C, s):
+        return "type"
+
+    @unify_dispatch.register(lambda u, v: isinstance(u, C) and u.ok)
+    def by_value(u, v, s):
+        return "value"
+
+    assert unify(C(True), C(True), {}) == "value"
+    assert unify(C(False), C(True), {}) == "type"
+
+
+def test_swapped_handlers_are_dispatched_on_swapped_types():
+    class D:
+        pass
+
+    @unify_dispatch.register(swap=True)
+    def unify_d(u: D, v: int, s):
+        return (u, v)
+
+    d = D()
+    assert unify(d, 1, {}) == (d, 1)
+    assert unify(1, d, {}) == (d, 1)
+
+
+class F:
+    """Minimal compound term that exposes its children to the engine"""
+
+    def __init__(self, *args):
+        self.args = args
+
+
+children_dispatch.register(F, lambda v: v.args)
+rebuild_dispatch.register(F, lambda v, children: F(*children))
+
+
+class Hashed(F):
+    """Compound term with a structural hash, which the engine must not compute"""
+
+    def __eq__(self, other):
+        return type(other) is Hashed and self.args == other.args
+
+    def __hash__(self):
+        raise AssertionError("compound terms are never looked up in substitutions")
+
+
+def deep_hashed(depth, leaf):
+    t = leaf
+    for i in range(depth):
+        t = Hashed(i, t)
+    return t
+
+
+def flatten(t):
+    if isinstance(t, F):
+        return tuple(map(flatten, t.args))
+    return t
+
+
+def test_unify_all_matches_folding_unify():
+    x, y, z, w = Var(), Var(), Var(), Var()
+    equations = [(x, F(y, 1)), (y, z), (F(z, w), F(2, 1))]
+
+    folded = {}
+    for u, v in equations:
+        folded = unify(u, v, folded)
+
+    s = unify_all(equations, {})
+    for var in (x, y, z, w):
+        assert flatten(walk_star(var, s)) == flatten(walk_star(var, folded))
+
+
+def test_unify_all_accepts_a_generator():
+    xs = [Var() for _ in range(100)]
+    y = Var()
+    s = unify_all(((x, i) for i, x in enumerate(xs)), {y: 0})
+    assert s == {y: 0, **{x: i for i, x in enumerate(xs)}}
+
+
+def test_unify_all_preserves_the_original_substitution():
+    a, b = Var(), Var()
+    sub = {a: 1}
+    unify_all([(b, 2)], sub)
+    assert sub == {a: 1}
+
+
+def test_unify_all_raises_mismatch():
+    x = Var()
+    with pytest.raises(Mismatch):
+        unify_all([(x, 1), (x, 2)], {})
+
+
+def test_unify_all_detects_cycles_at_the_end():
+    x, y, z = Var(), Var(), Var()
+    with pytest.raises(Cycle):
+        unify_all([(x, F(y)), (y, F(1, z)), (z, x)], {})
+
+
+def test_unify_all_terminates_on_cyclic_systems():
+    x, y = Var(), Var()
+    with pytest.raises(Cycle):
+        unify_all([(x, F(x)), (y, F(y)), (x, y)], {})
+
+
+def test_unify_all_solves_long_chains():
+    xs = [Var() for _ in range(5001)]
+    equations = [(xs[i + 1], F(xs[i])) for i in range(5000)]
+    s = unify_all(equations, {})
+    assert len(s) == 5000
+    with pytest.raises(Cycle):
+        unify_all(equations + [(xs[0], xs[-1])], {})
+
+
+def test_strict_occurs_policy_raises_on_binding():
+    x = Var()
+    with pytest.raises(Cycle):
+        unify(x, F(x), {})
+
+
+def test_deferred_occurs_policy_raises_in_final_cycle_check():
+    x, y = Var(), Var()
+    with occurs_policy(DEFERRED):
+        with pytest.raises(Cycle):
+            unify(x, F(x), {})
+        s = unify(x, F(y), {})
+        with pytest.raises(Cycle):
+            unify(y, F(x), s)
+        assert try_unify(y, F(x), s) is None
+        assert flatten(walk_star(x, try_unify(y, F(1), s))) == ((1,),)
+
+
+def test_unify_all_leaves_the_occurs_policy_of_other_unifications_alone():
+    x, y = Var(), Var()
+
+    def equations():
+        # unify_all defers its own checks, but not those of unifications its caller runs meanwhile
+        with pytest.raises(Cycle):
+            unify(x, F(x), {})
+        yield y, F(1)
+
+    assert flatten(walk_star(y, unify_all(equations(), {}))) == (1,)
+
+
+@patch("core.occurs")
+def test_deferred_occurs_policy_skips_per_binding_checks(occurs):
+    with occurs_policy(DEFERRED):
+        assert unify(Var(), F(1), {})
+    occurs.assert_not_called()
+
+
+def test_no_occurs_policy_unifies_rational_trees():
+    x, y = Var(), Var()
+    with occurs_policy(NONE):
+        s = unify(x, F(x), {})
+        s = unify(y, F(y), s)
+        s = unify(x, y, s)
+        s = unify_all([(x, F(F(y)))], s)
+    with pytest.raises(Cycle):
+        check_cycles(s)
+
+
+def test_bound_compound_terms_are_not_hashed():
+    x = Var()
+    t = deep_hashed(100, 1)
+    for s in ({x: t}, Hamt().set(x, t), ConstraintStore({x: t}), UnionFind({x: t})):
+        assert walk(x, s) is t
+        assert unify(x, t, s) is s
+        assert unify(t, x, s) is s
+    assert ConstraintStore({x: t}).constraint(x) is None
+
+
+def test_deferred_occurs_policy_checks_chains_of_bindings_once():
+    # with STRICT, binding each variable checks the whole chain of bindings below it again
+    xs = [Var() for _ in range(3001)]
+    chain = F(*[F(x, x) for x in xs[:-1]])
+    with occurs_policy(DEFERRED):
+        s = unify(F(*xs[1:]), chain, {})
+        assert walk(xs[-1], s) is chain.args[-1]
+        with pytest.raises(Cycle):
+            unify(F(xs[0], *xs[1:]), F(F(xs[-1], 1), *chain.args), {})
+
+
+def test_cycle_checks_do_not_hash_compound_terms():
+    x, y = Var(), Var()
+    t = deep_hashed(4000, y)
+    check_cycles(unify_all([(x, t)], {}))
+    with occurs_policy(DEFERRED):
+        unify(x, t, {})
+    with pytest.raises(Cycle):
+        check_cycles({x: t, y: Hashed(x)})
+
+
+def test_occurs_policy_is_restored_after_with_block():
+    with occurs_policy(NONE):
+        pass
+    x = Var()
+    with pytest.raises(Cycle):
+        unify(x, F(x), {})
+
+
+def test_unknown_occurs_policy_is_rejected():
+    with pytest.raises(ValueError):
+        set_occurs_policy("sometimes")
+
+
+def test_walk_star_preserves_sharing_in_dag_shaped_terms():
+    x = Var()
+    t = F(x, x)
+    for _ in range(200):
+        t = F(t, t)
+    r = walk_star(t, {x: 1})
+    assert r.args[0] is r.args[1]
+    assert r.args[0].args[0] is r.args[1].args[1]
+
+
+def test_walk_star_returns_unchanged_terms_as_they_are():
+    x, y = Var(), Var()
+    inner = F(1, y)
+    t = F(inner, F(x))
+    r = walk_star(t, {x: 2})
+    assert r is not t
+    assert r.args[0] is inner
+    assert walk_star(t, {}) is t
+
+
+def test_walk_star_all_shares_resolved_subterms():
+    x = Var()
+    shared = F(x, x)
+    a, b = walk_star_all([F(shared), F(1, shared)], {x: 0})
+    assert a.args[0] is b.args[1]
+    assert flatten(a) == ((0, 0),)
+
+
+def test_try_unify_returns_substitution_on_success():
+    x = Var()
+    assert try_unify(x, 1, {}) == {x: 1}
+
+
+def test_try_unify_returns_none_on_mismatch_or_cycle():
+    x = Var()
+    assert try_unify(F(1, 2), F(1, 3), {}) is None
+    assert try_unify(x, F(x), {}) is None
+
+
+def test_handlers_can_signal_failure_without_raising():
+    class G:
+        pass
+
+    @unify_dispatch.register()
+    def unify_g(u: G, v: G, s):
+        return None
+
+    assert try_unify(G(), G(), {}) is None
+    with pytest.raises(Mismatch):
+        unify(G(), G(), {})
+
+
+def test_failure_diagnostics_are_only_built_when_requested():
+    created = []
+
+    class Error(Exception):
+        def __init__(self, *args):
+            created.append(args)
+
+    class H:
+        pass
+
+    @unify_dispatch.register()
+    def unify_h(u: H, v: H, s):
+        return Failure(Error, u, v)
+
+    assert try_unify(H(), H(), {}) is None
+    assert created == []
+    with pytest.raises(Error):
+        unify(H(), H(), {})
+    assert len(created) == 1
+
+
+def test_try_unify_handles_raising_handlers():
+    class K:
+        pass
+
+    @unify_dispatch.register()
+    def unify_k(u: K, v: K, s):
+        raise Mismatch(u, v, s)
+
+    assert try_unify(K(), K(), {}) is None
+
+
+def test_match_binds_pattern_variables():
+    x, y = Var(), Var()
+    s = match(F(x, F(y, 2)), F(1, F(3, 2)), {})
+    assert s == {x: 1, y: 3}
+
+
+def test_match_fails_without_raising():
+    x = Var()
+    assert match(F(x, 2), F(1, 3), {}) is None
+    assert match(F(x), F(1, 2), {}) is None
+    assert match(1, 2, {}) is None
+
+
+def test_match_never_binds_term_variables():
+    x, y = Var(), Var()
+    assert match(1, x, {}) is None
+    assert match(x, y, {}) == {x: y}
+    assert match(F(x, x), F(1, y), {}) is None
+
+
+def test_match_respects_existing_bindings_of_pattern_variables():
+    x = Var()
+    assert match(F(x, x), F(1, 1), {}) == {x: 1}
+    assert match(F(x, x), F(1, 2), {}) is None
+    assert match(x, 2, {x: 2}) == {x: 2}
+
+
+def test_match_does_not_walk_the_term():
+    x, y = Var(), Var()
+    assert match(x, y, {y: 1}) == {y: 1, x: y}
+    # the value of a pattern variable is not looked up either
+    assert match(F(x, x), F(1, y), {y: 1}) is None
+    assert match(F(x, x), F(y, 1), {y: 1}) is None
+    assert match(F(x, x), F(y, y), {y: 1}) == {y: 1, x: y}
+
+
+@patch("core.occurs")
+def test_match_skips_the_occurs_check(occurs):
+    x = Var()
+    match(x, F(x), {})
+    occurs.assert_not_called()
+
+
+def test_match_dispatch_can_be_extended():
+    class Even:
+        pass
+
+    match_dispatch.register(Even, lambda p, t, s: s if t % 2 == 0 else None)
+    assert match(F(Even()), F(4), {}) == {}
+    assert match(F(Even()), F(3), {}) is None
+
+
+def test_match_handles_deep_terms():
+    x = Var()
+    pattern, term = x, 0
+    for _ in range(20000):
+        pattern, term = F(pattern), F(term)
+    assert match(pattern, term, {}) == {x: 0}
+
+
+@pytest.mark.parametrize("kind", [dict, Hamt, UnionFind])
+def test_compact_keeps_only_reachable_bindings(kind):
+    x, y, z, u, w = Var(), Var(), Var(), Var(), Var()
+    s = kind({x: F(y, 1), y: z, z: 2, u: 3, w: x})
+    c = compact(s, [x])
+    assert type(c) is kind
+    assert dict(c.items()).keys() == {x}
+    assert flatten(walk_star(x, c)) == (2, 1)
+
+
+def test_compact_keeps_variables_inside_roots():
+    x, y, z = Var(), Var(), Var()
+    s = {x: y, y: 1, z: 2}
+    c = compact(s, [F(x, z), 5])
+    assert c == {x: 1, z: 2}
+
+
+def test_find_keys_does_not_follow_bindings():
+    x, y, z = Var(), Var(), Var()
+    assert find_keys([F(y, F(x)), z, x], {x: y, y: 1}) == [y, x]
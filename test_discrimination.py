@@ -0,0 +1,113 @@
+import random
+
+import pytest
+
+from core import try_unify
+from discrimination import DiscriminationTree
+from hashcons import Interned
+from structure import Structure
+from variable import Var
+
+
+class F(Interned):
+    __slots__ = ()
+    fields = ("a", "b")
+
+
+class G(Interned):
+    __slots__ = ()
+    fields = ("a",)
+
+
+class Opaque(Structure):
+    def occurs(self, x, s):
+        return False
+
+    def unify(self, other, s):
+        return s
+
+    def walk_star(self, s):
+        return self
+
+
+def random_term(rng, variables, depth=3):
+    r = rng.random()
+    if depth == 0 or r < 0.3:
+        return rng.choice(variables + [1, 2, "a"])
+    if r < 0.65:
+        return F(
+            random_term(rng, variables, depth - 1),
+            random_term(rng, variables, depth - 1),
+        )
+    return G(random_term(rng, variables, depth - 1))
+
+
+def test_lookup_by_shape():
+    x, y = Var(), Var()
+    index = DiscriminationTree(
+        [(F(1, 2), "a"), (F(x, 2), "b"), (G(1), "c"), (x, "d"), (3, "e")]
+    )
+    assert len(index) == 5
+    assert index[F(x, 2)] == "b"
+    assert set(index.unifiable(F(1, y))) == {F(1, 2), F(x, 2), x}
+    assert set(index.unifiable(F(3, 2))) == {F(x, 2), x}
+    assert set(index.unifiable(y)) == {F(1, 2), F(x, 2), G(1), x, 3}
+    assert set(index.unifiable(3)) == {x, 3}
+
+
+def test_instances_and_generalizations():
+    x, y = Var(), Var()
+    index = DiscriminationTree(
+        [(F(1, 2), 0), (F(x, 2), 0), (F(x, y), 0), (G(1), 0), (y, 0)]
+    )
+    assert set(index.instances(F(x, 2))) == {F(1, 2), F(x, 2)}
+    assert set(index.instances(y)) == {F(1, 2), F(x, 2), F(x, y), G(1), y}
+    assert set(index.generalizations(F(1, 2))) == {F(1, 2), F(x, 2), F(x, y), y}
+    assert set(index.generalizations(F(1, x))) == {F(x, y), y}
+
+
+def test_query_is_walked():
+    x = Var()
+    index = DiscriminationTree([(F(1, 2), 0), (F(2, 2), 0)])
+    assert index.unifiable(F(x, 2), {x: 1}) == [F(1, 2)]
+
+
+def test_opaque_terms_match_anything():
+    opaque = Opaque()
+    index = DiscriminationTree([(F(opaque, 2), 0), (F(1, 3), 0)])
+    assert set(index.unifiable(F(1, 2))) == {F(opaque, 2)}
+    assert set(index.unifiable(opaque)) == {F(opaque, 2), F(1, 3)}
+    assert set(index.unifiable(F(opaque, 3))) == {F(1, 3)}
+
+
+def test_remove():
+    x = Var()
+    index = DiscriminationTree()
+    index.update([(F(1, 2), 0), (F(1, x), 0), (G(1), 0)])
+    index.remove(F(1, 2))
+    assert F(1, 2) not in index
+    assert index.unifiable(F(1, 2)) == [F(1, x)]
+    with pytest.raises(KeyError):
+        index.remove(F(1, 2))
+    index.remove_all([F(1, x), G(1), G(2)])
+    assert len(index) == 0
+    assert not index._root.children
+
+
+def test_unhashable_terms():
+    index = DiscriminationTree([([1], "list")])
+    assert index[[1]] == "list"
+    assert index.unifiable(Var()) == [[1]]
+
+
+def test_candidates_include_all_unifiable_terms():
+    rng = random.Random(0)
+    variables = [Var() for _ in range(3)]
+    stored = list({random_term(rng, variables) for _ in range(300)})
+    index = DiscriminationTree((t, None) for t in stored)
+    for _ in range(100):
+        query = random_term(rng, [Var() for _ in range(3)])
+        expected = [t for t in stored if try_unify(query, t, {}) is not None]
+        candidates = index.unifiable(query)
+        assert all(any(t is c for c in candidates) for t in expected)
+        assert len(candidates) <= len(stored)
@@ -0,0 +1,175 @@
+import itertools
+
+from constraint import ConstraintStore
+from core import try_unify, unify, unify_all, walk_star
+from finite_domain import (
+    After,
+    Before,
+    Domain,
+    Interval,
+    NotEqual,
+    Satisfies,
+    ac3,
+    domain,
+    labeling,
+    solve,
+)
+from goals import run
+from variable import Var
+
+
+def test_domain_set_operations():
+    d = Domain.of([1, 3, 5, 8])
+    assert list(d) == [1, 3, 5, 8]
+    assert len(d) == 4
+    assert (d.min, d.max) == (1, 8)
+    assert 3 in d and 4 not in d and -1 not in d and "3" not in d
+    assert d.restrict(2, 6) == Domain.of([3, 5])
+    assert d.restrict(-5, 0) == Domain(0)
+
+
+def test_combine_intersects():
+    assert Domain.of([1, 2, 3]).combine(Domain.of([2, 3, 4])) == Domain.of([2, 3])
+    assert Domain.of([1, 2, 3]).combine(Interval(3, 10)) == Domain.of([3])
+    assert Interval(0, 5).combine(Interval(3, 10)) == Interval(3, 5)
+    assert Interval(3, 10).combine(Domain.of([1, 4])) == Domain.of([4])
+    assert Domain.of([1]).combine(Domain.of([2])) is None
+    assert Interval(0, 1).combine(Interval(2, 3)) is None
+
+
+def test_negative_values():
+    d = Domain.of([-3, 0, 2])
+    assert list(d) == [-3, 0, 2]
+    assert (d.min, d.max) == (-3, 2)
+    assert -3 in d and -2 not in d and -4 not in d
+    assert d.restrict(-5, 0) == Domain.of([-3, 0])
+    assert d.combine(Domain.of([-3, 2, 5])) == Domain.of([-3, 2])
+    assert Interval(-3, 3).as_domain() == Domain.of(range(-3, 4))
+    assert domain(-2, {}) == Domain.of([-2])
+
+    x, y = Var(), Var()
+    s = unify_all([(x, Interval(-3, 3)), (y, Interval(-3, 3))], ConstraintStore())
+    solutions = {
+        (walk_star(x, t), walk_star(y, t)) for t in solve([x, y], [Before(x, y, 5)], s)
+    }
+    assert solutions == {
+        (a, b) for a in range(-3, 4) for b in range(-3, 4) if a + 5 <= b
+    }
+
+
+def test_variables_take_values_of_their_domain():
+    x = Var()
+    s = unify(x, Domain.of([2, 4]), ConstraintStore())
+    s = unify(x, Interval(3, 9), s)
+    assert s.constraint(x) == Domain.of([4])
+    assert try_unify(x, 2, s) is None
+    assert walk_star(x, unify(x, 4, s)) == 4
+
+
+def test_ac3_prunes_domains():
+    x, y = Var(), Var()
+    s = unify_all([(x, Interval(0, 9)), (y, Interval(0, 9))], ConstraintStore())
+    s = ac3([Before(x, y, 5)], s)
+    assert domain(x, s) == Domain.of(range(0, 5))
+    assert domain(y, s) == Domain.of(range(5, 10))
+
+
+def test_ac3_propagates_along_chains():
+    tasks = [Var() for _ in range(5)]
+    s = ConstraintStore()
+    for t in tasks:
+        s = unify(t, Interval(0, 12), s)
+    s = ac3([Before(a, b, 3) for a, b in zip(tasks, tasks[1:])], s)
+    assert [walk_star(t, s) for t in tasks] == [0, 3, 6, 9, 12]
+
+
+def test_ac3_detects_inconsistency():
+    x, y, z = Var(), Var(), Var()
+    s = ConstraintStore()
+    for v in (x, y, z):
+        s = unify(v, Domain.of([0, 1]), s)
+    s = ac3([NotEqual(x, y), NotEqual(y, z), NotEqual(x, z)], s)
+    assert s is not None
+    assert ac3([NotEqual(x, y), NotEqual(y, z), NotEqual(x, z)], unify(x, 0, s)) is None
+
+
+def test_ac3_ignores_unrestricted_variables():
+    x, y = Var(), Var()
+    s = unify(x, Interval(0, 3), {})
+    assert domain(y, ac3([Before(x, y)], s)) is None
+    assert domain(x, ac3([Before(x, y)], s)) == Domain.of(range(4))
+
+
+def test_bounds_relations_do_not_materialize_intervals():
+    x, y, z = Var(), Var(), Var()
+    s = unify_all(
+        [(x, Interval(0, 10**9)), (y, Interval(0, 10**9)), (z, Domain.of([0, 10**3]))],
+        ConstraintStore(),
+    )
+    s = ac3([Before(x, y, 5), After(x, z, 1)], s)
+    assert s.constraint(x) == Interval(1, 10**9 - 5)
+    assert s.constraint(y) == Interval(6, 10**9)
+    assert domain(z, s) == Domain.of([0, 10**3])
+
+    s = ac3([NotEqual(x, 1), NotEqual(y, 10**9)], s)
+    assert s.constraint(x) == Interval(2, 10**9 - 5)
+    assert s.constraint(y) == Interval(6, 10**9 - 1)
+
+
+def test_domains_equal_intervals_with_the_same_values():
+    assert Domain.of([2, 3, 4]) == Interval(2, 4)
+    assert Interval(2, 4) == Domain.of([2, 3, 4])
+    assert hash(Domain.of([2, 3, 4])) == hash(Interval(2, 4))
+    assert Domain.of([2, 4]) != Interval(2, 4)
+    assert Domain(0) != Interval(2, 4)
+    assert Interval(0, 5).discard(3) == Domain.of([0, 1, 2, 4, 5])
+
+
+def test_ac3_keeps_intervals_it_does_not_prune():
+    x, y = Var(), Var()
+    s = unify_all([(x, Interval(0, 10**6)), (y, Interval(-5, 5))], ConstraintStore())
+    s = ac3([Before(y, x, 2)], s)
+    assert s.constraint(x) == Interval(0, 10**6)
+    assert domain(y, s) == Domain.of(range(-5, 6))
+    assert s.constraint(y) == Interval(-5, 5)
+
+
+def test_ac3_with_predicates():
+    x, y = Var(), Var()
+    s = unify_all([(x, Interval(0, 10)), (y, Interval(0, 10))], ConstraintStore())
+    s = ac3([Satisfies(x, y, lambda a, b: a * a == b)], s)
+    assert domain(x, s) == Domain.of([0, 1, 2, 3])
+    assert domain(y, s) == Domain.of([0, 1, 4, 9])
+
+
+def test_solve_finds_all_solutions():
+    xs = [Var() for _ in range(3)]
+    s = ConstraintStore()
+    for x in xs:
+        s = unify(x, Interval(0, 2), s)
+    relations = [NotEqual(a, b) for a, b in itertools.combinations(xs, 2)]
+    solutions = {tuple(walk_star(x, t) for x in xs) for t in solve(xs, relations, s)}
+    assert solutions == set(itertools.permutations(range(3)))
+
+
+def test_labeling_goal():
+    x, y = Var(), Var()
+    s = unify_all([(x, Interval(0, 3)), (y, Interval(0, 3))], ConstraintStore())
+    solutions = labeling([x, y], [After(x, y, 2)])(s)
+    assert sorted((walk_star(x, t), walk_star(y, t)) for t in solutions) == [
+        (2, 0),
+        (3, 0),
+        (3, 1),
+    ]
+    assert sorted(run(None, x, labeling([x, y], [After(x, y, 2)]), s=s)) == [2, 3, 3]
+
+
+def test_ac3_on_long_chains_in_either_order():
+    tasks = [Var() for _ in range(1000)]
+    s = unify_all([(t, Interval(0, 3000)) for t in tasks], ConstraintStore())
+    chain = [Before(a, b, 2) for a, b in zip(tasks, tasks[1:])]
+    converse = [After(b, a, 2) for a, b in zip(tasks, tasks[1:])]
+    for relations in (chain, chain[::-1], converse, converse[::-1]):
+        result = ac3(relations, s)
+        assert domain(tasks[0], result).max == 1002
+        assert domain(tasks[-1], result).min == 1998
@@ -0,0 +1,131 @@
+from goals import conde, conj, disj, eq, fail, fresh, run, solutions, succeed
+from hashcons import Interned
+from variable import Var
+
+
+class Succ(Interned):
+    __slots__ = ()
+    fields = ("pred",)
+
+
+class Cons(Interned):
+    __slots__ = ()
+    fields = ("head", "tail")
+
+
+def nat(x):
+    return conde([eq(x, 0)], [fresh(lambda y: conj(eq(x, Succ(y)), nat(y)))])
+
+
+def appendo(a, b, out):
+    return conde(
+        [eq(a, ()), eq(b, out)],
+        [
+            fresh(
+                lambda h, t, rest: conj(
+                    eq(a, Cons(h, t)), eq(out, Cons(h, rest)), appendo(t, b, rest)
+                )
+            )
+        ],
+    )
+
+
+def cons_list(*items):
+    result = ()
+    for item in reversed(items):
+        result = Cons(item, result)
+    return result
+
+
+def test_eq_binds_the_query():
+    q = Var()
+    assert run(None, q, eq(q, 1)) == [1]
+
+
+def test_unresolved_query_stays_a_variable():
+    q = Var()
+    assert run(None, q, succeed) == [q]
+
+
+def test_failing_goals_produce_no_answers():
+    q = Var()
+    assert run(None, q, fail) == []
+    assert run(None, q, eq(q, 1), eq(q, 2)) == []
+
+
+def test_disj_produces_answers_of_all_goals():
+    q = Var()
+    assert run(None, q, disj(eq(q, 1), eq(q, 2), eq(q, 3))) == [1, 2, 3]
+
+
+def test_conj_requires_all_goals():
+    q = Var()
+    assert run(None, q, fresh(lambda x: conj(eq(x, 1), eq(q, Cons(x, 2))))) == [
+        Cons(1, 2)
+    ]
+
+
+def test_first_answers_of_an_infinite_search():
+    q = Var()
+    assert run(3, q, nat(q)) == [0, Succ(0), Succ(Succ(0))]
+
+
+def test_solutions_are_lazy():
+    q = Var()
+    answers = solutions(q, nat(q))
+    assert next(answers) == 0
+    assert next(answers) == Succ(0)
+
+
+def test_unproductive_search_does_not_starve_other_goals():
+    def forever():
+        return fresh(lambda: forever())
+
+    q = Var()
+    assert run(1, q, disj(forever(), eq(q, 1))) == [1]
+    assert run(1, q, conj(disj(forever(), succeed), eq(q, 2))) == [2]
+
+
+def test_deep_recursion_does_not_exhaust_the_stack():
+    def many(x):
+        return disj(eq(x, 1), fresh(lambda: many(x)))
+
+    q = Var()
+    assert run(3000, q, many(q)) == [1] * 3000
+    # the query is a constant, since resolving every answer of nat takes time quadratic in their number
+    assert len(run(3000, True, nat(q))) == 3000
+
+
+def test_goals_may_be_plain_functions():
+    def one_or_two(x):
+        def goal(s):
+            yield from eq(x, 1)(s)
+            yield None
+            yield from eq(x, 2)(s)
+
+        return goal
+
+    q = Var()
+    assert run(None, q, fresh(lambda x: conj(one_or_two(x), eq(q, Cons(x, x))))) == [
+        Cons(1, 1),
+        Cons(2, 2),
+    ]
+
+
+def test_conj_interleaves_infinite_streams():
+    q = Var()
+    assert run(1, q, conj(nat(q), eq(q, Succ(Succ(0))))) == [Succ(Succ(0))]
+
+
+def test_relations_can_run_backwards():
+    q = Var()
+    answers = run(
+        None,
+        q,
+        fresh(lambda a, b: conj(eq(q, Cons(a, b)), appendo(a, b, cons_list(1, 2)))),
+    )
+    assert answers == [
+        Cons((), cons_list(1, 2)),
+        Cons(cons_list(1), cons_list(2)),
+        Cons(cons_list(1, 2), ()),
+    ]
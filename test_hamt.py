@@ -0,0 +1,90 @@
+import pytest
+from core import occurs, unify, walk, walk_star
+from hamt import Hamt
+from variable import Var
+
+
+class Colliding:
+    def __init__(self, name):
+        self.name = name
+
+    def __hash__(self):
+        return 42
+
+    def __eq__(self, other):
+        return isinstance(other, Colliding) and self.name == other.name
+
+
+def test_empty_hamt_has_no_items():
+    assert len(Hamt()) == 0
+    assert Hamt() == {}
+
+
+def test_set_returns_extended_copy_and_preserves_original():
+    a = Hamt()
+    b = a.set("x", 1)
+    c = b.set("y", 2)
+    assert a == {}
+    assert b == {"x": 1}
+    assert c == {"x": 1, "y": 2}
+
+
+def test_set_replaces_existing_key():
+    h = Hamt({"x": 1}).set("x", 2)
+    assert h == {"x": 2}
+    assert len(h) == 1
+
+
+def test_many_keys_can_be_stored_and_retrieved():
+    h = Hamt()
+    for i in range(5000):
+        h = h.set(i, str(i))
+    assert len(h) == 5000
+    assert all(h[i] == str(i) for i in range(5000))
+    assert sorted(h) == list(range(5000))
+
+
+def test_colliding_hashes_are_kept_apart():
+    a, b, c = Colliding("a"), Colliding("b"), Colliding("c")
+    h = Hamt().set(a, 1).set(b, 2).set(c, 3)
+    assert (h[a], h[b], h[c]) == (1, 2, 3)
+    assert h.delete(b) == {a: 1, c: 3}
+
+
+def test_delete_removes_key_and_preserves_original():
+    h = Hamt({i: i for i in range(100)})
+    d = h.delete(50)
+    assert 50 not in d
+    assert len(d) == 99
+    assert h[50] == 50
+    with pytest.raises(KeyError):
+        d.delete(50)
+
+
+def test_lookup_of_missing_or_unhashable_key():
+    h = Hamt({"x": 1})
+    assert h.get("y") is None
+    assert [] not in h
+    with pytest.raises(KeyError):
+        h["y"]
+
+
+def test_or_operator_extends_like_a_dict():
+    h = Hamt({"x": 1}) | {"y": 2}
+    assert isinstance(h, Hamt)
+    assert h == {"x": 1, "y": 2}
+
+
+def test_walk_and_occurs_accept_hamt():
+    a, b, c = Var(), Var(), Var()
+    s = Hamt({b: c, c: a})
+    assert walk(b, s) is a
+    assert occurs(a, b, s)
+
+
+def test_unify_extends_hamt_substitution():
+    a, b = Var(), Var()
+    s = unify(a, 42, Hamt())
+    s = unify(b, a, s)
+    assert isinstance(s, Hamt)
+    assert walk_star(b, s) == 42
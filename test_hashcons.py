@@ -0,0 +1,96 @@
+from unittest.mock import patch
+import gc
+import pickle
+import pytest
+from core import Mismatch, occurs, unify, walk_star
+from hashcons import Interned, _table
+from variable import Var
+
+
+class Pair(Interned):
+    __slots__ = ()
+    fields = ("car", "cdr")
+
+
+class Single(Interned):
+    __slots__ = ()
+    fields = ("item",)
+
+
+def test_equal_structures_are_identical():
+    x = Var()
+    assert Pair(1, Pair(x, "a")) is Pair(1, Pair(x, "a"))
+    assert Pair(1, 2) is not Pair(1, 3)
+    assert Pair(1, 2) is not Single(Pair(1, 2))
+
+
+def test_equal_arguments_of_different_types_are_distinguished():
+    assert Single(1) is not Single(True)
+    assert Single((True,)) is not Single((1,))
+    assert Single(((1, True),)) is Single(((1, True),))
+    assert Single(1) is not Single(1.0)
+
+
+def test_fields_are_accessible_by_name():
+    p = Pair(1, 2)
+    assert (p.car, p.cdr) == (1, 2)
+    with pytest.raises(TypeError):
+        Pair(1)
+
+
+def test_hash_is_precomputed_and_consistent_with_identity():
+    assert hash(Pair(1, 2)) == hash(Pair(1, 2))
+    assert {Pair(1, 2): "x"}[Pair(1, 2)] == "x"
+
+
+def test_unused_structures_are_collected():
+    before = len(_table)
+    p = Pair(object(), 1)
+    assert len(_table) == before + 1
+    del p
+    gc.collect()
+    assert len(_table) == before
+
+
+def test_variables_and_groundness_are_cached():
+    x, y = Var(), Var()
+    t = Pair(x, Single(Pair(y, 1)))
+    assert t.variables == {x, y}
+    assert not t.is_ground
+    assert Pair(1, Single("a")).is_ground
+
+
+@patch("core.occurs_dispatch")
+def test_occurs_skips_ground_subterms(occurs_dispatch):
+    occurs_dispatch.return_value = False
+    x = Var()
+    assert not occurs(x, Pair(Pair(1, 2), Pair(3, 4)), {})
+    occurs_dispatch.assert_not_called()
+
+
+def test_occurs_finds_variables():
+    x, y = Var(), Var()
+    assert occurs(x, Pair(1, Single(x)), {})
+    assert occurs(x, Pair(1, Single(y)), {y: Pair(x, 2)})
+    assert not occurs(x, Pair(1, Single(y)), {})
+
+
+def test_walk_star_returns_unchanged_subterms_as_is():
+    x, y = Var(), Var()
+    ground = Pair(1, 2)
+    t = Pair(ground, Single(x))
+    assert walk_star(t, {y: 5}) is t
+    assert walk_star(t, {x: 5}) is Pair(ground, Single(5))
+
+
+def test_unify_interned_structures():
+    x, y = Var(), Var()
+    s = unify(Pair(x, Single(2)), Pair(1, Single(y)), {})
+    assert s == {x: 1, y: 2}
+    with pytest.raises(Mismatch):
+        unify(Pair(1, Single(2)), Pair(1, Single(3)), {})
+
+
+def test_pickling_preserves_identity():
+    p = Pair(1, Single("a"))
+    assert pickle.loads(pickle.dumps(p)) is p
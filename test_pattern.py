@@ -0,0 +1,122 @@
+import random
+
+from constraint import ConstraintStore
+from core import children_dispatch, match, rebuild_dispatch, unify
+from finite_domain import Interval
+from hamt import Hamt
+from hashcons import Interned
+from pattern import _cached_factory, compile_pattern
+from variable import Var
+
+
+class F(Interned):
+    __slots__ = ()
+    fields = ("a", "b")
+
+
+class G(Interned):
+    __slots__ = ()
+    fields = ("a",)
+
+
+class Plain:
+    """Compound term that is not interned"""
+
+    def __init__(self, *args):
+        self.args = args
+
+
+children_dispatch.register(Plain, lambda v: v.args)
+rebuild_dispatch.register(Plain, lambda v, children: Plain(*children))
+
+
+def random_term(rng, leaves, depth=3):
+    r = rng.random()
+    if depth == 0 or r < 0.3:
+        return rng.choice(leaves)
+    if r < 0.65:
+        return F(
+            random_term(rng, leaves, depth - 1), random_term(rng, leaves, depth - 1)
+        )
+    return G(random_term(rng, leaves, depth - 1))
+
+
+def test_compiled_pattern_binds_variables():
+    x, y = Var(), Var()
+    m = compile_pattern(F(x, G(y)))
+    assert m(F(1, G(2)), {}) == {x: 1, y: 2}
+    assert m(F(1, F(2, 3)), {}) is None
+    assert m(G(1), {}) is None
+
+
+def test_repeated_and_bound_variables():
+    x, y = Var(), Var()
+    m = compile_pattern(F(x, x))
+    assert m(F(1, 1), {}) == {x: 1}
+    assert m(F(1, 2), {}) is None
+    assert m(F(y, y), {x: y, y: 2}) == {x: y, y: 2}
+    # the value of x is not looked up, like in core.match
+    assert m(F(2, 2), {x: y, y: 2}) is None
+
+
+def test_term_variables_are_not_bound():
+    x, y = Var(), Var()
+    assert compile_pattern(F(1, x))(F(y, 2), {}) is None
+    assert compile_pattern(F(x, 2))(F(y, 2), {}) == {x: y}
+
+
+def test_patterns_with_plain_compounds():
+    x = Var()
+    m = compile_pattern(Plain(1, Plain(x)))
+    assert m(Plain(1, Plain(5)), {}) == {x: 5}
+    assert m(Plain(1, Plain(5, 6)), {}) is None
+    assert m(Plain(2, Plain(5)), {}) is None
+
+
+def test_other_parts_are_matched_with_match():
+    x = Var()
+    m = compile_pattern(F(x, Interval(0, 9)))
+    assert m(F(1, 5), {}) == {x: 1}
+    assert m(F(1, 50), {}) is None
+
+
+def test_unhashable_constants():
+    x = Var()
+    m = compile_pattern(Plain(x, [1, 2]))
+    assert m(Plain(0, [1, 2]), {}) == {x: 0}
+    assert m(Plain(0, [1]), {}) is None
+
+
+def test_substitution_types_are_respected():
+    x = Var()
+    m = compile_pattern(F(x, 2))
+    s = m(F(1, 2), Hamt())
+    assert isinstance(s, Hamt) and s[x] == 1
+
+    s = unify(x, Interval(0, 3), ConstraintStore())
+    assert m(F(9, 2), s) is None
+    assert m(F(3, 2), s)[x] == 3
+
+
+def test_variants_share_compiled_code():
+    x, y = Var(), Var()
+    compile_pattern(F(x, G(y)))
+    hits = _cached_factory.cache_info().hits
+    m = compile_pattern(F(y, G(x)))
+    assert _cached_factory.cache_info().hits == hits + 1
+    assert m(F(1, G(2)), {}) == {y: 1, x: 2}
+
+
+def test_compiled_patterns_agree_with_match():
+    rng = random.Random(0)
+    for _ in range(300):
+        variables = [Var() for _ in range(3)]
+        pattern = random_term(rng, variables + [1, 2])
+        bound = Var()
+        term = random_term(rng, [1, 2, Var(), bound])
+        assert compile_pattern(pattern)(term, {}) == match(pattern, term, {})
+        # variables of the term are not looked up, even if they are bound
+        s = {bound: 1}
+        assert compile_pattern(pattern)(term, s) == match(pattern, term, s)
+        s = {bound: 1, variables[0]: bound}
+        assert compile_pattern(pattern)(term, s) == match(pattern, term, s)
@@ -1,7 +1,8 @@
 from unittest.mock import Mock
 import pytest
-from core import unify, occurs
-from structure import Structure
+from core import match, unify, unify_all, occurs, walk_star, Cycle, Mismatch
+from structure import Structure, structure
+from variable import Var
 
 
 def test_occurs_is_not_called_on_first_argument():
@@ -28,11 +29,115 @@ def test_unify_is_called_on_either_argument_and_gets_passed_the_other():
         pytest.fail("did not return unification of one of the terms")
 
 
+def test_structures_with_children_are_unified_element_wise():
+    a, b = Var(), Var()
+    s = unify(Node(a, 2), Node(1, b), {})
+    assert s == {a: 1, b: 2}
+
+
+def test_structures_with_different_numbers_of_children_do_not_unify():
+    with pytest.raises(Mismatch):
+        unify(Node(1, 2), Node(1, 2, 3), {})
+
+
+def test_walk_star_rebuilds_structures_with_children():
+    a = Var()
+    assert walk_star(Node(a, Node(a)), {a: 5}) == Node(5, Node(5))
+
+
+def test_deep_structures_do_not_exhaust_the_stack():
+    depth = 20000
+    x, y = Var(), Var()
+    left, right = x, y
+    for i in range(depth):
+        left, right = Node(i, left), Node(i, right)
+
+    s = unify(left, right, {})
+    assert s == {x: y} or s == {y: x}
+    assert occurs(y, left, {x: y})
+    assert not occurs(Var(), left, s)
+    assert walk_star(left, {x: 0}) is not left
+
+
+def test_match_is_called_on_the_pattern_only():
+    a, b = SpyStructure(), SpyStructure()
+    assert match(a, b, {}) == a.match_.return_value
+    a.match_.assert_called_once_with(b, {})
+    b.match_.assert_not_called()
+
+
+def test_opaque_structures_match_equal_terms_by_default():
+    a = Var()
+    assert match(Opaque(a), Opaque(1), {}) is None
+    assert match(Opaque(1), Opaque(a), {}) is None
+    assert match(Opaque(a), Opaque(a), {}) == {}
+
+
+def test_structures_with_children_are_matched_element_wise():
+    a = Var()
+    assert match(Node(a, 2), Node(1, 2), {}) == {a: 1}
+    assert match(Node(a, 2), Node(1, 2, 3), {}) is None
+
+
+def test_unify_all_detects_cycles_through_opaque_structures():
+    x, y = Var(), Var()
+    with pytest.raises(Cycle):
+        unify_all([(x, Opaque(y)), (y, Node(1, x))], {})
+    s = unify_all([(x, Opaque(y)), (y, Node(1, 2))], {})
+    assert walk_star(x, s) == Opaque(Node(1, 2))
+
+
+def test_opaque_structures_can_not_be_rebuilt():
+    with pytest.raises(TypeError, match="cannot rebuild Opaque"):
+        Opaque(1).rebuild((2,))
+
+
+class Opaque(Structure):
+    def __init__(self, item):
+        self.item = item
+
+    def occurs(self, x, s):
+        return occurs(x, self.item, s)
+
+    def unify(self, other, s):
+        return unify(self.item, other.item, s)
+
+    def walk_star(self, s):
+        return Opaque(walk_star(self.item, s))
+
+    def __eq__(self, other):
+        return isinstance(other, Opaque) and self.item == other.item
+
+
+class Node(Structure):
+    def __init__(self, *items):
+        self.items = items
+
+    def occurs(self, x, s):
+        return any(occurs(x, i, s) for i in self.items)
+
+    def unify(self, other, s):
+        raise Mismatch(self, other)
+
+    def walk_star(self, s):
+        return Node(*(walk_star(i, s) for i in self.items))
+
+    def children(self):
+        return self.items
+
+    def rebuild(self, children):
+        return Node(*children)
+
+    def __eq__(self, other):
+        return isinstance(other, Node) and self.items == other.items
+
+
 class SpyStructure(Structure):
     def __init__(self):
         self.occurs_ = Mock()
         self.unify_ = Mock()
         self.walk_ = Mock()
+        self.match_ = Mock()
 
     def occurs(self, x, s):
         return self.occurs_(x, s)
@@ -42,3 +147,78 @@ class SpyStructure(Structure):
 
     def walk_star(self, s):
         return self.walk_(s)
+
+    def match(self, term, s):
+        return self.match_(term, s)
+
+
+@structure
+class Cons:
+    head: object
+    tail: object
+
+
+@structure
+class Leaf:
+    pass
+
+
+def test_structure_decorator_creates_slotted_structures():
+    c = Cons(1, 2)
+    assert isinstance(c, Structure)
+    assert Cons.__slots__ == ("head", "tail")
+    assert not hasattr(c, "__dict__")
+    assert (c.head, c.tail) == (1, 2)
+    assert c.children() == (1, 2)
+    assert c.rebuild((3, 4)) == Cons(3, 4)
+    assert repr(c) == "Cons(1, 2)"
+    assert Leaf() == Leaf() and Leaf().children() == ()
+
+
+def test_structure_decorator_derives_equality_and_hash():
+    assert Cons(1, Cons(2, 3)) == Cons(1, Cons(2, 3))
+    assert Cons(1, 2) != Cons(2, 1)
+    assert Cons(1, 2) != Node(1, 2)
+    assert hash(Cons(1, Cons(2, 3))) == hash(Cons(1, Cons(2, 3)))
+
+
+def test_equality_and_hash_of_deep_structures():
+    left, right = None, None
+    for i in range(5000):
+        left, right = Cons(i, left), Cons(i, right)
+    assert left == right
+    assert hash(left) == hash(right)
+    assert left != Cons(-1, right.tail)
+    assert Cons(Leaf(), 1) == Cons(Leaf(), 1) and Cons(Leaf(), 1) != Cons(1, 1)
+
+
+def test_structure_decorator_derives_unification():
+    x, y = Var(), Var()
+    s = unify(Cons(x, Cons(2, y)), Cons(1, Cons(2, 3)), {})
+    assert walk_star(Cons(x, y), s) == Cons(1, 3)
+    assert Cons(x, 2).unify(Cons(1, 2), {}) == {x: 1}
+    assert Cons(x, 2).unify(Node(1, 2), {}) is None
+    assert occurs(x, Cons(1, Cons(x, 2)), {})
+    assert Cons(1, Cons(x, 2)).occurs(x, {})
+    assert Cons(1, 2).walk_star({}) == Cons(1, 2)
+    with pytest.raises(Cycle):
+        unify(x, Cons(1, x), {})
+
+
+def test_structure_decorator_keeps_methods_of_the_class():
+    @structure
+    class Named:
+        name: str
+
+        def __repr__(self):
+            return self.name
+
+    assert repr(Named("a")) == "a"
+
+
+def test_structure_fields_can_not_have_defaults():
+    with pytest.raises(TypeError):
+
+        @structure
+        class WithDefault:
+            x: int = 0
@@ -1,120 +1,675 @@
+import concurrent.futures
+import copy
 from dataclasses import dataclass
+import hashlib
+import heapq
+import io
+import pickle
+import sqlite3
 from typing import Any, Type
-import typing
+import weakref
 
-from core import occurs, unify, walk_star
+from core import (
+    Failure,
+    bind,
+    children_dispatch,
+    compact,
+    rebuild_dispatch,
+    unify,
+    unify_dispatch,
+    walk_star,
+    walk_star_all,
+)
 from variable import Var
-from structure import Structure
+from variant import variant_key
+from structure import structure
 
 
-class Pair(Structure):
-    def __init__(self, car, cdr):
-        self.car = car
-        self.cdr = cdr
+@structure
+class Pair:
+    car: Any
+    cdr: Any
+
+    def __repr__(self):
+        return f"({self.car} . {self.cdr})"
+
+
+class TypeVar(Var):
+    """Type variable, tagged with the level of the innermost function that may generalize it."""
+
+    __slots__ = ("level",)
+
+    def __init__(self, level):
+        super().__init__()
+        self.level = level
+
+    def __reduce__(self):
+        return TypeVar, (self.level,)
+
+
+@unify_dispatch.register(swap=True)
+def unify_type_variable(u: TypeVar, v: Any, s):
+    s = bind(u, v, s)
+    if type(s) is not Failure:
+        # variables that now appear in u's type escape to u's level
+        for x in type_variables([walk_star(v, s)]):
+            if x.level > u.level:
+                x.level = u.level
+    return s
+
+
+def type_variables(types):
+    """Return the type variables in types, in order of first occurrence."""
+    found = {}
+    for t in types:
+        for x in variant_key(t)[1]:
+            if isinstance(x, TypeVar):
+                found[x] = None
+    return list(found)
 
-    def occurs(self, x, s) -> bool:
-        return occurs(x, self.car, s) or occurs(x, self.cdr, s)
 
-    def unify(self, other, s):
-        raise NotImplementedError()
+class Scheme:
+    """Type with generic variables, which every instance replaces with fresh variables.
 
-    def walk_star(self, s):
-        return Pair(walk_star(self.car, s), walk_star(self.cdr, s))
+    Instances are built by generated code, which shares all parts of the type that contain no generic variable.
+    """
+
+    def __init__(self, types, level):
+        self.types = tuple(types)
+        self.generic = [x for x in type_variables(self.types) if x.level > level]
+        self.instantiate = _compile_template(self.types, self.generic)
+
+    def key(self):
+        """Return the types with the generic variables replaced by numbered placeholders, which is equal for
+        schemes that are equal up to renaming."""
+        placeholders = {x: Generic(i) for i, x in enumerate(self.generic)}
+        return tuple(walk_star_all(self.types, placeholders))
+
+    def __reduce__(self):
+        # variables only make sense in the process that created them, so generic ones are sent as placeholders
+        types = self.key()
+        if type_variables(types):
+            raise TypeError(
+                "cannot pickle a scheme with variables that are not generic"
+            )
+        return _load_scheme, (types, len(self.generic))
 
     def __repr__(self):
-        return f"({self.car} . {self.cdr})"
+        return f"Scheme({self.types!r}, generic={self.generic!r})"
+
+
+class Generic:
+    """Placeholder for the generic variable with the given index in a pickled scheme."""
+
+    __slots__ = ("index",)
+
+    def __init__(self, index):
+        self.index = index
 
     def __eq__(self, other):
-        if not isinstance(other, Pair):
-            return NotImplemented
-        return self.car == other.car and self.cdr == other.cdr
+        return type(other) is Generic and other.index == self.index
+
+    def __hash__(self):
+        return hash((Generic, self.index))
+
+    def __repr__(self):
+        return f"Generic({self.index})"
+
+
+def _load_scheme(types, n):
+    variables = {Generic(i): TypeVar(1) for i in range(n)}
+    return Scheme(walk_star_all(types, variables), level=0)
+
+
+def _compile_template(types, generic):
+    """Generate a function that takes a level and returns types with the generic variables replaced by fresh
+    variables of that level."""
+    numbers = {x: i for i, x in enumerate(generic)}
+    namespace = {"TypeVar": TypeVar, "rebuild": rebuild_dispatch}
+
+    def constant(t):
+        name = f"k{len(namespace)}"
+        namespace[name] = t
+        return name
+
+    def expression(t):
+        # source that builds t, or None if t contains no generic variable and can be shared
+        if isinstance(t, TypeVar):
+            return f"v{numbers[t]}" if t in numbers else None
+        kids = children_dispatch(t)
+        if kids is None:
+            return None
+        parts = [expression(c) for c in kids]
+        if all(p is None for p in parts):
+            return None
+        children = "".join(
+            f"{constant(c) if p is None else p}, " for c, p in zip(kids, parts)
+        )
+        return f"rebuild({constant(t)}, ({children}))"
+
+    results = "".join(f"{expression(t) or constant(t)}, " for t in types)
+    source = "\n".join(
+        [
+            "def instantiate(level):",
+            *(f"    v{i} = TypeVar(level)" for i in range(len(generic))),
+            f"    return ({results})",
+        ]
+    )
+    exec(compile(source, "<scheme>", "exec"), namespace)
+    return namespace["instantiate"]
+
+
+COMPACT_THRESHOLD = 1000
+# part of every content hash, to be increased whenever the type checker infers different schemes for the same code
+SIGNATURE_VERSION = 1
 
 
 class TypeChecker:
-    def __init__(self):
+    """Collects type equations in a substitution.
+
+    Called functions are instantiated at the checker's level. roots returns the terms the checker still needs.
+    At every checkpoint, a substitution that has grown to threshold bindings is compacted down to what the roots
+    depend on, and the next compaction waits until it has doubled again, so the total work stays linear.
+    """
+
+    def __init__(self, roots=None, threshold=COMPACT_THRESHOLD, level=1):
         self.substitution = {}
+        self.level = level
+        self.roots = roots
+        self.threshold = threshold
+        self._limit = threshold
 
     def eq(self, t1, t2):
         self.substitution = unify(t1, t2, self.substitution)
 
+    def checkpoint(self):
+        if self.roots is not None and len(self.substitution) >= self._limit:
+            self.compact(self.roots())
+
+    def compact(self, roots):
+        self.substitution = compact(self.substitution, roots)
+        self._limit = max(self.threshold, 2 * len(self.substitution))
+
     def resolve(self, var):
         return walk_star(var, self.substitution)
 
+    def resolve_all(self, terms):
+        return walk_star_all(terms, self.substitution)
+
 
 class Function:
     def __init__(self, arity, code):
         self.arity = arity
         self.code = code
-        self._signature = None
-
-    def signature(self):
-        if self._signature is None:
-            args, ret = self.infer_signature()
-            self._signature = (ret,) + tuple(args)
-
-        mapping = {}
-
-        vars = []
-        for param in self._signature:
-            try:
-                var = mapping[param]
-            except KeyError:
-                var = Var()
-                mapping[param] = var
-            vars.append(var)
-
-        ret = vars[0]
-        params = vars[1:]
+        self._scheme = None
+        self._order = None
+        # functions whose schemes were inferred with this function's scheme, and the callees last recorded
+        self._callers = weakref.WeakSet()
+        self._callees = ()
+        self._hash = None
+
+    def __getstate__(self):
+        # callers are recorded again where the copy is inferred
+        state = self.__dict__.copy()
+        del state["_callers"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._callers = weakref.WeakSet()
+
+    def scheme(self):
+        """Return the generalized signature of this function, as a scheme of (ret, *params)."""
+        if self._scheme is None:
+            infer_program([self])
+        return self._scheme
+
+    def callees(self):
+        """Return the functions this function's code calls."""
+        return list(dict.fromkeys(op.value for op in self.code if isinstance(op, Func)))
+
+    def record_calls(self):
+        """Register this function as a caller of its callees, replacing what was recorded before."""
+        for callee in self._callees:
+            callee._callers.discard(self)
+        self._callees = self.callees()
+        for callee in self._callees:
+            callee._callers.add(self)
+
+    def signature(self, level=0):
+        """Return fresh parameter and return types of the given level."""
+        ret, *params = self.scheme().instantiate(level)
         return params, ret
 
-    def infer_signature(self):
-        tc = TypeChecker()
+    def block_order(self):
+        """Return the position of each reachable instruction in reverse postorder of the control-flow graph.
 
-        args = tuple([Var() for _ in range(self.arity)])
-        ret = Var()
+        Visiting instructions in this order reaches every join point from all its forward edges first.
+        """
+        if self._order is None:
+            postorder = []
+            visited = {0}
+            stack = [(0, iter(self.code[0].successors(0)))]
+            while stack:
+                ip, successors = stack[-1]
+                for nxt in successors:
+                    if nxt not in visited:
+                        visited.add(nxt)
+                        stack.append((nxt, iter(self.code[nxt].successors(nxt))))
+                        break
+                else:
+                    stack.pop()
+                    postorder.append(ip)
+            self._order = {ip: i for i, ip in enumerate(reversed(postorder))}
+        return self._order
+
+    def infer_signature(self, threshold=COMPACT_THRESHOLD):
+        level = 1
+        args = tuple([TypeVar(level) for _ in range(self.arity)])
+        ret = TypeVar(level)
+        tc = TypeChecker(threshold=threshold, level=level)
+        self.check(tc, args, ret)
+        *args, ret = tc.resolve_all([*args, ret])
+        return args, ret
 
-        queue = [State(args, ret)]
+    def check(self, tc, args, ret, keep=()):
+        """Add the type equations of this function's code for the given argument and return types to tc.
+        keep are other types that compaction must preserve."""
+        order = self.block_order()
+        # the first state to reach each address; later ones are unified with it right away
         states = {}
+        queue = []
+
+        def arrive(state):
+            old_state = states.get(state.ip)
+            if old_state is None:
+                states[state.ip] = state
+                heapq.heappush(queue, (order[state.ip], state.ip))
+                return
+            a, b = state.stack, old_state.stack
+            assert len(a) == len(b)
+            # below the part the paths pushed themselves, the stacks are the same
+            while a is not b:
+                tc.eq(a.top, b.top)
+                a, b = a.rest, b.rest
+
+        def roots():
+            live = [*keep, *args, ret]
+            seen = set()
+            for state in states.values():
+                # stacks share their tails, which only have to be visited once
+                stack = state.stack
+                while stack.depth and id(stack) not in seen:
+                    seen.add(id(stack))
+                    live.append(stack.top)
+                    stack = stack.rest
+            return live
+
+        tc.roots = roots
+        arrive(State(args, ret))
         while queue:
-            state = queue.pop()
+            tc.checkpoint()
+            _, ip = heapq.heappop(queue)
+            for state in self.code[ip].typecheck(states[ip], tc):
+                arrive(state)
 
-            if state.ip in states:
-                old_state = states[state.ip]
-                assert len(state.stack) == len(old_state.stack)
-                for a, b in zip(state.stack, old_state.stack):
-                    tc.eq(a, b)
-                continue
 
-            states[state.ip] = state
+def _inferred_function(arity, scheme):
+    function = Function(arity, None)
+    function._scheme = scheme
+    return function
 
-            op = self.code[state.ip]
-            next_states = op.typecheck(state, tc)
-            queue.extend(next_states)
 
-        args = [tc.resolve(a) for a in args]
-        ret = tc.resolve(ret)
-        return args, ret
+class _TaskPickler(pickle.Pickler):
+    """Pickles the functions of a component with their code, and the inferred functions they call as their
+    scheme only."""
+
+    def __init__(self, file, component):
+        super().__init__(file)
+        self.component = set(component)
+
+    def reducer_override(self, obj):
+        if (
+            type(obj) is Function
+            and obj not in self.component
+            and obj._scheme is not None
+        ):
+            return _inferred_function, (obj.arity, obj._scheme)
+        return NotImplemented
+
+
+def _pickle_task(component):
+    file = io.BytesIO()
+    _TaskPickler(file, component).dump(component)
+    return file.getvalue()
+
+
+def _infer_task(payload, threshold):
+    return infer_component(pickle.loads(payload), threshold)
+
+
+def infer_component(functions, threshold=COMPACT_THRESHOLD):
+    """Infer the schemes of a strongly connected component of the call graph. Calls within the component are
+    monomorphic; all other callees must have schemes already."""
+    level = 1
+    tc = TypeChecker(threshold=threshold, level=level)
+    signatures = []
+    for function in functions:
+        args = tuple([TypeVar(level) for _ in range(function.arity)])
+        ret = TypeVar(level)
+        signatures.append((ret, *args))
+        # nothing is generic at the component's own level, so every call shares these types
+        function._scheme = Scheme((ret, *args), level)
+    keep = [t for signature in signatures for t in signature]
+    try:
+        for function, (ret, *args) in zip(functions, signatures):
+            function.check(tc, args, ret, keep)
+    except BaseException:
+        for function in functions:
+            function._scheme = None
+        raise
+    for function, signature in zip(functions, signatures):
+        function._scheme = Scheme(tc.resolve_all(signature), level=0)
+    return [function._scheme for function in functions]
+
+
+def call_graph(functions):
+    """Return the functions without a scheme that functions call, directly or indirectly, including
+    functions themselves, mapped to the ones among them that they call."""
+    graph = {}
+    todo = list(functions)
+    while todo:
+        function = todo.pop()
+        if function in graph or function._scheme is not None:
+            continue
+        graph[function] = [c for c in function.callees() if c._scheme is None]
+        todo.extend(graph[function])
+    return graph
+
+
+def components(graph):
+    """Return the strongly connected components of graph, each after all components it has edges to."""
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    result = []
+
+    def visit(v):
+        index[v] = low[v] = len(index)
+        stack.append(v)
+        on_stack.add(v)
+        return v, iter(graph[v])
+
+    for root in graph:
+        if root in index:
+            continue
+        work = [visit(root)]
+        while work:
+            v, edges = work[-1]
+            for w in edges:
+                if w not in index:
+                    work.append(visit(w))
+                    break
+                if w in on_stack:
+                    low[v] = min(low[v], index[w])
+            else:
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    low[u] = min(low[u], low[v])
+                if low[v] == index[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack.discard(w)
+                        component.append(w)
+                        if w is v:
+                            break
+                    result.append(component)
+    return result
+
+
+def invalidate(function, threshold=COMPACT_THRESHOLD, cache=None):
+    """Re-infer function after its code changed, and then the functions that depend on it.
+
+    Components of the call graph are re-inferred in order, callees first. A caller is only re-inferred if the
+    scheme of one of its callees changed other than by renaming variables. Return the re-inferred functions.
+    """
+    affected = {function}
+    todo = [function]
+    while todo:
+        for caller in todo.pop()._callers:
+            if caller not in affected:
+                affected.add(caller)
+                todo.append(caller)
+    graph = {f: [c for c in f.callees() if c in affected] for f in affected}
+
+    function._order = None
+    for f in affected:
+        f._hash = None
+    changed = set()
+    inferred = []
+    for component in components(graph):
+        if function not in component and not any(
+            c in changed for f in component for c in graph[f]
+        ):
+            continue
+        old = {f: None if f._scheme is None else f._scheme.key() for f in component}
+        for f in component:
+            f._scheme = None
+        infer_program(component, threshold=threshold, cache=cache)
+        inferred.extend(component)
+        changed.update(f for f in component if f._scheme.key() != old[f])
+    return inferred
+
+
+def infer_program(functions, executor=None, threshold=COMPACT_THRESHOLD, cache=None):
+    """Infer the schemes of functions and of all functions they call.
+
+    Each strongly connected component of the call graph is inferred once the components it calls are done.
+    Given an executor, such as a ProcessPoolExecutor, independent components are inferred in parallel. Tasks
+    carry the code of their component and only the schemes of the functions it calls. Given a SignatureCache,
+    components are looked up in it first, and the ones that had to be inferred are stored in it.
+    """
+    graph = call_graph(functions)
+    for function in graph:
+        function.record_calls()
+    if cache is not None:
+        cache.load(graph)
+        graph = call_graph(functions)
+
+    order = components(graph)
+    if executor is None:
+        for component in order:
+            infer_component(component, threshold)
+    else:
+        _infer_in_parallel(order, graph, executor, threshold)
+
+    if cache is not None:
+        cache.store(graph)
+
+
+def _infer_in_parallel(order, graph, executor, threshold):
+    number = {f: i for i, component in enumerate(order) for f in component}
+    callers = [[] for _ in order]
+    waiting = []
+    for i, component in enumerate(order):
+        callees = {number[c] for f in component for c in graph[f]} - {i}
+        waiting.append(len(callees))
+        for j in callees:
+            callers[j].append(i)
+
+    ready = [i for i, n in enumerate(waiting) if n == 0]
+    running = {}
+    while ready or running:
+        for i in ready:
+            task = _pickle_task(order[i])
+            running[executor.submit(_infer_task, task, threshold)] = i
+        ready = []
+        done, _ = concurrent.futures.wait(
+            running, return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        for future in done:
+            i = running.pop(future)
+            for function, scheme in zip(order[i], future.result()):
+                function._scheme = scheme
+            for j in callers[i]:
+                waiting[j] -= 1
+                if waiting[j] == 0:
+                    ready.append(j)
+
+
+def content_hashes(functions):
+    """Compute the content hashes of functions and of all functions they call.
+
+    The hash of a function covers its arity, its code, the hashes of its callees and SIGNATURE_VERSION, so it
+    changes whenever anything the function's scheme depends on changes. Mutually recursive functions are hashed
+    together.
+    """
+    graph = {}
+    todo = list(functions)
+    while todo:
+        function = todo.pop()
+        if function in graph or function._hash is not None:
+            continue
+        graph[function] = [c for c in function.callees() if c._hash is None]
+        todo.extend(graph[function])
+
+    for component in components(graph):
+        index = {f: i for i, f in enumerate(component)}
+        digest = hashlib.sha256(repr(SIGNATURE_VERSION).encode())
+        for function in component:
+            code = [_instruction_key(op, index) for op in function.code]
+            digest.update(repr((function.arity, code)).encode())
+        for i, function in enumerate(component):
+            function._hash = f"{digest.hexdigest()}:{i}"
+
+
+def _instruction_key(op, index):
+    if isinstance(op, Func):
+        callee = op.value
+        # calls within the component refer to its position, since its hash is not known yet
+        return ("call", index[callee]) if callee in index else ("call", callee._hash)
+    if isinstance(op, Const):
+        # only the type of a constant matters, and its repr may not tell types apart
+        return _type_key(type(op)), _type_key(type(op.value))
+    return _type_key(type(op)), sorted(vars(op).items())
+
+
+def _type_key(cls):
+    return cls.__module__, cls.__qualname__
+
+
+class SignatureCache:
+    """Schemes of functions in an SQLite database, keyed by their content hashes.
+
+    Any number of processes can read the database while one writes. Entries for old versions of a function are
+    never read again, since any change gives the function a different hash. Schemes are stored pickled, so the
+    database must be trusted.
+    """
+
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS schemes (hash TEXT PRIMARY KEY, scheme BLOB NOT NULL)"
+        )
+        self._connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def get(self, function):
+        """Return the stored scheme of function, or None."""
+        content_hashes([function])
+        row = self._connection.execute(
+            "SELECT scheme FROM schemes WHERE hash = ?", (function._hash,)
+        ).fetchone()
+        return None if row is None else pickle.loads(row[0])
+
+    def load(self, graph):
+        """Give the functions in the call graph the schemes stored for them. Mutually recursive functions are
+        only loaded if all of them are stored."""
+        for component in components(graph):
+            schemes = [self.get(function) for function in component]
+            if None not in schemes:
+                for function, scheme in zip(component, schemes):
+                    function._scheme = scheme
+
+    def store(self, functions):
+        """Store the schemes of functions."""
+        content_hashes(functions)
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO schemes VALUES (?, ?)",
+                [(f._hash, pickle.dumps(f._scheme)) for f in functions],
+            )
+
+
+class Stack:
+    """Persistent stack. Pushed stacks share the stack beneath them, so push and pop take constant time."""
+
+    __slots__ = ("top", "rest", "depth")
+
+    def __init__(self, top=None, rest=None):
+        self.top = top
+        self.rest = rest
+        self.depth = 0 if rest is None else rest.depth + 1
+
+    def push(self, x):
+        return Stack(x, self)
+
+    def __len__(self):
+        return self.depth
+
+    def __iter__(self):
+        """Iterate from the top of the stack."""
+        stack = self
+        while stack.depth:
+            yield stack.top
+            stack = stack.rest
+
+
+EMPTY_STACK = Stack()
 
 
-@dataclass
 class State:
-    args: typing.Tuple
-    retval: typing.Any
-    ip: int = 0
-    stack: typing.Tuple = ()
+    """Abstract state of a function at an instruction address."""
+
+    __slots__ = ("args", "retval", "ip", "stack")
+
+    def __init__(self, args, retval, ip=0, stack=EMPTY_STACK):
+        self.args = args
+        self.retval = retval
+        self.ip = ip
+        self.stack = stack
 
     def advance(self, offset=1):
         return State(self.args, self.retval, self.ip + offset, self.stack)
 
     def push(self, x):
-        return State(self.args, self.retval, self.ip, self.stack + (x,))
+        return State(self.args, self.retval, self.ip, self.stack.push(x))
 
     def pop(self):
-        return self.stack[-1], State(self.args, self.retval, self.ip, self.stack[:-1])
+        stack = self.stack
+        return stack.top, State(self.args, self.retval, self.ip, stack.rest)
+
+
+class Op:
+    def successors(self, ip):
+        """Return the addresses that may be executed after this instruction at ip."""
+        return (ip + 1,)
 
 
 @dataclass
-class Const:
+class Const(Op):
     value: Any
 
     def typecheck(self, state: State, tc: TypeChecker):
@@ -122,29 +677,35 @@ class Const:
 
 
 @dataclass
-class Func:
+class Func(Op):
     value: Function
 
     def typecheck(self, state: State, tc: TypeChecker):
         yield state.push(self.value).advance()
 
 
-class Return:
+class Return(Op):
     def typecheck(self, state: State, tc: TypeChecker):
-        tc.eq(state.retval, state.stack[-1])
+        tc.eq(state.retval, state.stack.top)
         return []
 
+    def successors(self, ip):
+        return ()
+
 
 @dataclass
-class Jump:
+class Jump(Op):
     offset: int
 
     def typecheck(self, state: State, tc: TypeChecker):
         yield state.advance(self.offset + 1)
 
+    def successors(self, ip):
+        return (ip + self.offset + 1,)
+
 
 @dataclass
-class Branch:
+class Branch(Op):
     offset: int
 
     def typecheck(self, state: State, tc: TypeChecker):
@@ -153,26 +714,29 @@ class Branch:
         yield state.advance()
         yield state.advance(self.offset + 1)
 
+    def successors(self, ip):
+        return (ip + 1, ip + self.offset + 1)
+
 
 @dataclass
-class Arg:
+class Arg(Op):
     idx: int
 
     def typecheck(self, state: State, tc: TypeChecker):
         yield state.push(state.args[self.idx]).advance()
 
 
-class Apply:
+class Apply(Op):
     def typecheck(self, state: State, tc: TypeChecker):
         func, state = state.pop()
-        params, ret = func.signature()
+        params, ret = func.signature(tc.level)
         for prm in params:
             arg, state = state.pop()
             tc.eq(prm, arg)
         yield state.push(ret).advance()
 
 
-class Cons:
+class Cons(Op):
     def typecheck(self, state: State, tc: TypeChecker):
         cdr, state = state.pop()
         car, state = state.pop()
@@ -236,3 +800,268 @@ def test_infer_application_with_different_types():
     args, ret = func.infer_signature()
     assert args == []
     assert ret == Pair(int, str)
+
+
+def test_compaction_keeps_signature():
+    identity = Function(1, [Arg(0), Return()])
+    first = Function(2, [Arg(0), Return()])
+    code = [Const(42)]
+    for _ in range(50):
+        code += [Const("foo"), Func(first), Apply(), Const(1.0), Func(identity)]
+        code += [Apply(), Cons()]
+    code += [Return()]
+    func = Function(0, code)
+    assert func.infer_signature(threshold=1) == func.infer_signature()
+
+
+def test_compaction_drops_dead_bindings():
+    x, y, z = Var(), Var(), Var()
+    tc = TypeChecker(lambda: [x], threshold=3)
+    tc.eq(x, Pair(y, int))
+    tc.eq(y, z)
+    tc.eq(z, str)
+    tc.checkpoint()
+    assert tc.substitution == {x: Pair(str, int)}
+    assert tc.resolve(x) == Pair(str, int)
+
+
+def test_instantiation_renames_nested_variables():
+    duplicate = Function(1, [Arg(0), Arg(0), Cons(), Return()])
+    func = Function(
+        0,
+        [
+            Const(42),
+            Func(duplicate),
+            Apply(),
+            Const("foo"),
+            Func(duplicate),
+            Apply(),
+            Cons(),
+            Return(),
+        ],
+    )
+    args, ret = func.infer_signature()
+    assert ret == Pair(Pair(int, int), Pair(str, str))
+
+
+def test_instances_share_parts_without_generic_variables():
+    tagged = Function(1, [Const(1), Const("a"), Cons(), Arg(0), Cons(), Return()])
+    (p1,), r1 = tagged.signature()
+    (p2,), r2 = tagged.signature(level=3)
+    assert p1 is not p2 and p2.level == 3
+    assert r1 == Pair(Pair(int, str), p1)
+    assert r1.car is r2.car
+
+
+def test_binding_lowers_levels_of_escaping_variables():
+    outer, inner = TypeVar(1), TypeVar(2)
+    unify(outer, Pair(inner, int), {})
+    assert inner.level == 1
+    assert Scheme([Pair(outer, inner)], level=1).generic == []
+
+
+def diamonds(n):
+    """Code that pushes the result of n if-then-else blocks."""
+    code = []
+    for _ in range(n):
+        code += [Arg(0), Branch(2), Const(1), Jump(1), Arg(1)]
+    return code + [Return()]
+
+
+def test_join_points_are_checked_once():
+    checked = []
+
+    class Join(Op):
+        def typecheck(self, state, tc):
+            checked.append(state.ip)
+            yield state.advance()
+
+    code = diamonds(3)
+    code[-1:-1] = [Join()]
+    args, ret = Function(2, code).infer_signature()
+    assert args == [bool, int] and ret == int
+    assert checked == [len(code) - 2]
+
+
+def test_infer_large_function():
+    args, ret = Function(2, diamonds(5000)).infer_signature()
+    assert args == [bool, int] and ret == int
+
+
+def recursive_pair():
+    """even and odd, which call each other"""
+    even, odd = Function(1, None), Function(1, None)
+    for function, other in [(even, odd), (odd, even)]:
+        function.code = [
+            Arg(0),
+            Branch(2),
+            Const(True),
+            Return(),
+            Arg(0),
+            Func(other),
+            Apply(),
+            Return(),
+        ]
+    return even, odd
+
+
+def test_infer_mutually_recursive_functions():
+    even, odd = recursive_pair()
+    assert even.signature() == ([bool], bool)
+    assert odd.scheme().types == (bool, bool)
+
+
+def test_call_graph_components():
+    even, odd = recursive_pair()
+    identity = Function(1, [Arg(0), Return()])
+    main = Function(1, [Arg(0), Func(even), Apply(), Func(identity), Apply(), Return()])
+    graph = call_graph([main])
+    assert set(graph) == {main, even, odd, identity}
+    order = components(graph)
+    assert [set(c) for c in order[-1:]] == [{main}]
+    assert {even, odd} in [set(c) for c in order]
+
+
+def test_schemes_are_pickled_without_variables():
+    duplicate = Function(1, [Arg(0), Arg(0), Cons(), Return()])
+    scheme = duplicate.scheme()
+    loaded = pickle.loads(pickle.dumps(scheme))
+    assert loaded.key() == scheme.key()
+    assert not set(loaded.generic) & set(scheme.generic)
+    assert b"TypeVar" not in pickle.dumps(scheme)
+
+    caller = Function(0, [Const(1), Func(duplicate), Apply(), Return()])
+    (task,) = pickle.loads(_pickle_task([caller]))
+    assert task.code[1].value.code is None
+    assert task.infer_signature() == ([], Pair(int, int))
+
+
+def test_copies_of_inferred_functions_keep_their_code():
+    duplicate = Function(1, [Arg(0), Arg(0), Cons(), Return()])
+    caller = Function(0, [Const(1), Func(duplicate), Apply(), Return()])
+    infer_program([caller])
+    for clone in (copy.deepcopy(caller), pickle.loads(pickle.dumps(caller))):
+        assert len(clone.code) == 4 and clone.code[1].value.code is not None
+        assert clone.scheme().key() == caller.scheme().key()
+        assert clone.signature() == ([], Pair(int, int))
+
+
+def make_program(chains, length):
+    """Independent chains of functions that each pair their argument with the result of the previous one."""
+    program = []
+    for i in range(chains):
+        previous = Function(1, [Arg(0), Return()])
+        for _ in range(length):
+            previous = Function(
+                1, [Arg(0), Func(previous), Apply(), Arg(0), Cons(), Return()]
+            )
+        program.append(previous)
+    program.append(Function(0, [Const(1), Func(program[0]), Apply(), Return()]))
+    program.extend(recursive_pair())
+    return program
+
+
+def test_infer_program_in_parallel():
+    serial = make_program(4, 10)
+    infer_program(serial)
+    parallel = make_program(4, 10)
+    with concurrent.futures.ProcessPoolExecutor(2) as executor:
+        infer_program(parallel, executor)
+    for a, b in zip(serial, parallel):
+        assert a.scheme().key() == b.scheme().key()
+    assert parallel[4].signature()[1].cdr is int
+
+
+def test_invalidate_reinfers_callers_of_changed_signatures():
+    leaf = Function(1, [Arg(0), Return()])
+    middle = Function(1, [Arg(0), Func(leaf), Apply(), Return()])
+    top = Function(0, [Const(1), Func(middle), Apply(), Return()])
+    other = Function(0, [Const("a"), Return()])
+    infer_program([top, other])
+    assert top.signature() == ([], int)
+
+    leaf.code = [Const("a"), Return()]
+    assert invalidate(leaf) == [leaf, middle, top]
+    assert top.signature() == ([], str)
+
+
+def test_invalidate_stops_at_signatures_unchanged_up_to_renaming():
+    leaf = Function(1, [Arg(0), Return()])
+    top = Function(0, [Const(1), Func(leaf), Apply(), Return()])
+    top.scheme()
+
+    leaf.code = [Arg(0), Jump(0), Return()]
+    assert invalidate(leaf) == [leaf]
+    assert top.signature() == ([], int)
+
+
+def test_invalidate_follows_new_calls():
+    even, odd = recursive_pair()
+    identity = Function(1, [Arg(0), Return()])
+    main = Function(0, [Const(1), Func(identity), Apply(), Return()])
+    main.scheme()
+
+    main.code = [Const(True), Func(even), Apply(), Return()]
+    assert invalidate(main) == [main]
+    assert main.signature() == ([], bool)
+    assert identity not in [*even._callers, *odd._callers]
+    assert main in even._callers and main not in identity._callers
+
+
+def test_content_hashes_cover_callees():
+    first, second = make_program(1, 3)[0], make_program(1, 3)[0]
+    content_hashes([first, second])
+    assert first._hash == second._hash
+    even, odd = recursive_pair()
+    content_hashes([even])
+    assert odd._hash is not None and odd._hash != even._hash
+
+    changed = make_program(1, 3)[0]
+    changed.callees()[0].callees()[0].code[0] = Arg(1)
+    content_hashes([changed])
+    assert changed._hash != first._hash
+
+
+class One:
+    def __repr__(self):
+        return "1"
+
+
+def test_content_hashes_tell_constants_of_different_types_apart():
+    functions = [Function(0, [Const(value), Return()]) for value in (1, One(), 2)]
+    content_hashes(functions)
+    assert functions[0]._hash != functions[1]._hash
+    assert functions[0]._hash == functions[2]._hash
+
+
+def counting(check, checked):
+    def wrapper(self, *args):
+        checked.append(self)
+        return check(self, *args)
+
+    return wrapper
+
+
+def test_signature_cache_survives_restarts(tmp_path, monkeypatch):
+    path = tmp_path / "signatures.db"
+    expected = make_program(2, 5)
+    with SignatureCache(path) as cache:
+        infer_program(expected, cache=cache)
+
+    checked = []
+    monkeypatch.setattr(Function, "check", counting(Function.check, checked))
+    # a new program with the same code finds everything in the cache
+    program = make_program(2, 5)
+    with SignatureCache(path) as cache:
+        infer_program(program, cache=cache)
+    assert checked == []
+    for a, b in zip(expected, program):
+        assert a.scheme().key() == b.scheme().key()
+
+    # an edited function misses the cache, the functions it calls do not
+    program = make_program(2, 5)
+    program[2].code = [Const("a"), Func(program[0]), Apply(), Return()]
+    with SignatureCache(path) as cache:
+        infer_program(program, cache=cache)
+    assert checked == [program[2]]
+    assert program[2].signature()[1].cdr is str
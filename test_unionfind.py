@@ -0,0 +1,98 @@
+from core import Mismatch, unify, unify_dispatch, walk, walk_star, occurs
+from unionfind import UnionFind
+from variable import Var
+import pytest
+
+
+def test_find_returns_term_if_unbound():
+    s = UnionFind()
+    x = Var()
+    assert s.find(x) is x
+    assert s.find(42) == 42
+
+
+def test_find_compresses_paths():
+    a, b, c, d = Var(), Var(), Var(), Var()
+    s = UnionFind()
+    s._parent.update({a: b, b: c, c: d})
+    assert s.find(a) is d
+    assert s._parent[a] is d
+    assert s._parent[b] is d
+
+
+def test_lower_ranked_variable_is_linked_to_higher_ranked():
+    a, b, d = Var(), Var(), Var()
+    s = UnionFind()
+    s.bind(a, b)
+    s.bind(b, d)
+    assert s.find(d) is b
+    assert s.find(a) is b
+
+
+def test_undo_restores_marked_state():
+    a, b, c = Var(), Var(), Var()
+    s = UnionFind()
+    s.bind(a, b)
+    m = s.mark()
+    s.bind(b, c)
+    s.bind(b, 42)
+    assert s.find(a) == 42
+    assert s.find(c) == 42
+    s.undo_to(m)
+    assert s.find(a) is b
+    assert dict(s) == {a: b}
+
+
+def test_undo_reverts_path_compression():
+    a, b, c = Var(), Var(), Var()
+    s = UnionFind()
+    s.bind(a, b)
+    m = s.mark()
+    s.bind(b, 42)
+    assert s.find(a) == 42
+    s.undo_to(m)
+    assert s.find(a) is b
+    assert s.find(b) is b
+
+
+def test_unify_mutates_and_returns_the_store():
+    a, b = Var(), Var()
+    s = UnionFind()
+    assert unify(a, b, s) is s
+    assert unify(b, 42, s) is s
+    assert walk(a, s) == 42
+    assert walk_star(b, s) == 42
+
+
+def test_occurs_follows_store():
+    a, b, c = Var(), Var(), Var()
+    s = UnionFind({b: c})
+    assert occurs(c, b, s)
+    assert not occurs(a, b, s)
+
+
+def test_backtracking_after_failed_unification():
+    a = Var()
+    s = UnionFind()
+    m = s.mark()
+    unify(a, 1, s)
+    with pytest.raises(Mismatch):
+        unify(a, 2, s)
+    s.undo_to(m)
+    unify(a, 2, s)
+    assert walk(a, s) == 2
+
+
+def test_registered_handlers_work_unchanged():
+    class Box:
+        def __init__(self, x):
+            self.x = x
+
+    @unify_dispatch.register()
+    def unify_box(u: Box, v: Box, s):
+        return unify(u.x, v.x, s)
+
+    a = Var()
+    s = UnionFind()
+    unify(Box(a), Box(7), s)
+    assert walk(a, s) == 7
@@ -1,5 +1,6 @@
+import pickle
 from core import unify, occurs
-from variable import Var
+from variable import Var, variable_count
 
 
 def test_different_variables_dont_occur_in_each_other():
@@ -44,3 +45,26 @@ def test_unifying_a_variable_with_a_value_associates_the_variable_with_the_value
 
     s = unify(42, var, {})
     assert s == {var: 42}
+
+
+def test_variables_have_consecutive_ids():
+    a, b = Var(), Var()
+    assert b.id == a.id + 1
+    assert variable_count() == b.id + 1
+
+
+def test_unpickled_variables_get_new_ids():
+    x = Var()
+    y, z = pickle.loads(pickle.dumps([x, x]))
+    assert y is z and y is not x
+    assert y.id == variable_count() - 1
+
+
+def test_variable_names_are_cached():
+    var = Var()
+    assert repr(var) is repr(var)
+    assert repr(var) != repr(Var())
+
+
+def test_variables_are_slotted():
+    assert not hasattr(Var(), "__dict__")
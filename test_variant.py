@@ -0,0 +1,117 @@
+import pytest
+
+import containers  # noqa: F401
+from constraint import ConstraintStore
+from core import Cycle, Mismatch, unify, walk_star
+from finite_domain import Interval
+from hashcons import Interned
+from variable import Var
+from variant import UnifyCache, variant_key
+
+
+class F(Interned):
+    __slots__ = ()
+    fields = ("a", "b")
+
+
+def test_variants_have_equal_keys():
+    x, y, a, b = Var(), Var(), Var(), Var()
+    assert variant_key(F(x, F(y, x)))[0] == variant_key(F(a, F(b, a)))[0]
+    assert variant_key(F(x, F(y, x)))[1] == [x, y]
+    assert variant_key(F(x, x))[0] != variant_key(F(x, y))[0]
+    assert variant_key(F(1, x))[0] != variant_key(F(True, x))[0]
+    assert variant_key(F(1, x))[0] != variant_key(F(x, 1))[0]
+
+
+def test_cache_returns_the_same_results_as_unify():
+    cached = UnifyCache()
+    x, y = Var(), Var()
+    for u, v in [
+        (F(x, F(1, y)), F(2, F(1, x))),
+        (F(x, y), F(y, 3)),
+        (x, F(1, y)),
+    ]:
+        expected = walk_star((x, y), unify(u, v, {}))
+        assert walk_star((x, y), cached(u, v, {})) == expected
+        assert walk_star((x, y), cached(u, v, {})) == expected
+
+
+def test_variant_problems_reuse_the_cached_unifier():
+    cached = UnifyCache()
+    x, y, a, b = Var(), Var(), Var(), Var()
+    cached(F(x, y), F(1, 2), {})
+    s = cached(F(x, y), F(1, F(x, 2)), {})
+    assert walk_star(y, s) == F(1, 2)
+
+    s = cached(F(a, b), F(1, F(a, 2)), {})
+    assert walk_star(b, s) == F(1, 2)
+    assert cached.cache_info() == (1, 2, 1024, 2)
+
+
+def test_terms_are_resolved_in_the_substitution():
+    cached = UnifyCache()
+    x, y, z = Var(), Var(), Var()
+    s = cached(F(x, y), F(1, z), {x: 1, z: 5})
+    assert walk_star(y, s) == 5
+    with pytest.raises(Mismatch):
+        cached(F(x, y), F(1, z), {x: 2, z: 5})
+    assert cached.cache_info().misses == 2
+
+
+def test_failures_are_cached():
+    cached = UnifyCache()
+    x, a = Var(), Var()
+    with pytest.raises(Cycle):
+        cached(x, F(1, x), {})
+    with pytest.raises(Cycle):
+        cached(a, F(1, a), {})
+    with pytest.raises(Mismatch):
+        cached(F(1, x), F(2, x), {})
+    assert cached.cache_info().hits == 1
+
+
+def test_least_recently_used_results_are_evicted():
+    cached = UnifyCache(maxsize=2)
+    x = Var()
+    cached(x, 1, {})
+    cached(x, 2, {})
+    cached(x, 1, {})
+    cached(x, 3, {})
+    assert cached.cache_info() == (1, 3, 2, 2)
+    cached(x, 1, {})
+    assert cached.cache_info().hits == 2
+    cached(x, 2, {})
+    assert cached.cache_info().hits == 2
+
+    cached.cache_clear()
+    assert cached.cache_info() == (0, 0, 2, 0)
+
+
+def test_unhashable_problems_are_not_cached():
+    cached = UnifyCache()
+    x = Var()
+    # sets are constants, and not hashable
+    assert walk_star(x, cached((x, {1}), (1, {1}), {})) == 1
+    assert cached.cache_info() == (0, 1, 1024, 0)
+
+
+def test_results_are_added_to_the_substitution_type():
+    cached = UnifyCache()
+    x = Var()
+    s = unify(x, Interval(0, 3), ConstraintStore())
+    with pytest.raises(Mismatch):
+        cached(F(x, 1), F(7, 1), s)
+    assert walk_star(x, cached(F(x, 1), F(2, 1), s)) == 2
+
+
+def test_constraints_found_by_unification_are_kept():
+    cached = UnifyCache()
+    x, a = Var(), Var()
+    for _ in range(2):
+        s = cached(F(x, 1), F(Interval(0, 5), 1), ConstraintStore())
+        assert s.constraint(x) == Interval(0, 5)
+        with pytest.raises(Mismatch):
+            unify(x, 50, s)
+    s = cached(F(a, 1), F(Interval(0, 5), 1), ConstraintStore())
+    assert s.constraint(a) == Interval(0, 5)
+    assert cached.cache_info() == (0, 3, 1024, 1)
@@ -0,0 +1,130 @@
+"""Mutable union-find substitution with trail-based backtracking.
+
+UnionFind is an alternative to functional substitutions for workloads that never need older versions of the
+substitution. Binding a variable updates the store in place, so unify returns the same object it was given.
+Lookups follow variable chains with path compression and variables are linked by rank, which keeps chains short.
+
+Because the store is mutated, a failed unification may leave partial bindings behind. Search code that needs to
+backtrack takes a mark() before trying something and calls undo_to(mark) to restore the store:
+
+    m = s.mark()
+    try:
+        unify(u, v, s)
+    except (Mismatch, Cycle):
+        s.undo_to(m)
+"""
+
+from collections.abc import Mapping
+
+from core import Substitution, Term, _is_compound, extend_dispatch, update_dispatch
+from variable import Var
+
+_missing = object()
+
+
+class UnionFind(Mapping):
+    """Union-find store mapping variables to terms."""
+
+    __slots__ = ("_parent", "_rank", "_trail")
+
+    def __init__(self, items=()):
+        self._parent = {}
+        self._rank = {}
+        self._trail = []
+        if isinstance(items, Mapping):
+            items = items.items()
+        for x, v in items:
+            self.bind(x, v)
+
+    def find(self, v: Term) -> Term:
+        """Return the term at the end of v's chain, compressing the path on the way."""
+        # terms with children are never bound, and hashing them to find out may take time linear in their size
+        if _is_compound(v):
+            return v
+        parent = self._parent
+        try:
+            root = parent[v]
+        except (KeyError, TypeError):
+            return v
+
+        path = []
+        while not _is_compound(root):
+            try:
+                nxt = parent[root]
+            except (KeyError, TypeError):
+                break
+            path.append(v)
+            v, root = root, nxt
+
+        for node in path:
+            self._set(parent, node, root)
+        return root
+
+    def bind(self, x: Term, v: Term):
+        """Associate the unbound x with v. If v is an unbound variable too, the lower ranked one is linked
+        to the other."""
+        if isinstance(v, Var) and v not in self._parent:
+            rank = self._rank
+            rx = rank.get(x, 0)
+            rv = rank.get(v, 0)
+            if rx > rv:
+                x, v = v, x
+            elif rx == rv:
+                self._set(rank, v, rv + 1)
+        self._set(self._parent, x, v)
+
+    def mark(self) -> int:
+        """Return a mark that undo_to can restore the current state from."""
+        return len(self._trail)
+
+    def undo_to(self, mark: int):
+        """Revert all changes made since mark was taken."""
+        trail = self._trail
+        while len(trail) > mark:
+            table, key, old = trail.pop()
+            if old is _missing:
+                del table[key]
+            else:
+                table[key] = old
+
+    def _set(self, table, key, value):
+        self._trail.append((table, key, table.get(key, _missing)))
+        table[key] = value
+
+    def get(self, key, default=None):
+        v = self.find(key)
+        return default if v is key else v
+
+    def __getitem__(self, key):
+        v = self.find(key)
+        if v is key:
+            raise KeyError(key)
+        return v
+
+    def __contains__(self, key):
+        try:
+            return key in self._parent
+        except TypeError:
+            return False
+
+    def __iter__(self):
+        return iter(self._parent)
+
+    def __len__(self):
+        return len(self._parent)
+
+    def __repr__(self):
+        return f"UnionFind({dict(self.items())!r})"
+
+
+@extend_dispatch.register
+def extend_union_find(s: UnionFind, x: Term, v: Term) -> Substitution:
+    s.bind(x, v)
+    return s
+
+
+@update_dispatch.register
+def update_union_find(s: UnionFind, bindings: Substitution) -> Substitution:
+    for x, v in bindings.items():
+        s.bind(x, v)
+    return s
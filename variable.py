@@ -1,19 +1,53 @@
-from core import occurs_dispatch, unify_dispatch, extend_substitution
+from core import bind, extend_dispatch, match_dispatch, occurs_dispatch, unify_dispatch
+import threading
 from typing import Any
 
 from funny_id import hash_id
 
+# the lock keeps ids distinct when threads create variables at the same time
+_lock = threading.Lock()
+_next_id = 0
+
 
 class Var:
+    """Logic variable. Each variable has a unique integer id; ids are handed out consecutively from zero, so
+    they can be used to index dense arrays of size variable_count(). Ids are only unique within a process, so
+    an unpickled variable is a new variable with a new id."""
+
+    __slots__ = ("id", "_name")
+
+    def __init__(self):
+        global _next_id
+        with _lock:
+            self.id = _next_id
+            _next_id += 1
+        self._name = None
+
+    def __reduce__(self):
+        return type(self), ()
+
     def __repr__(self):
-        return f"<{hash_id(id(self), separator='-')}>"
+        if self._name is None:
+            self._name = f"<{hash_id(self.id, separator='-')}>"
+        return self._name
+
+
+def variable_count() -> int:
+    """Return the number of variables created so far, which is one more than the largest id."""
+    return _next_id
 
 
 @unify_dispatch.register(swap=True)
 def unify_variable(u: Var, v: Any, s):
-    return extend_substitution(u, v, s)
+    return bind(u, v, s)
 
 
 @occurs_dispatch.register
 def occurs_variable(v: Var, x, s):
     return v == x
+
+
+@match_dispatch.register
+def match_variable(p: Var, t, s):
+    # matching binds pattern variables to parts of the term, which can not contain them, so no occurs check
+    return extend_dispatch(s, p, t)
@@ -0,0 +1,199 @@
+"""Variant keys and a cache of unification results.
+
+Two terms are variants of each other if they are equal up to renaming of variables. variant_key describes a term
+by its preorder traversal, with variables numbered by first occurrence, so variants have equal keys:
+
+    variant_key(F(x, G(y, x)))[0] == variant_key(F(a, G(b, a)))[0]
+
+UnifyCache wraps unify with a bounded LRU cache from the variant key of a unification problem to its most general
+unifier. Problems that are variants of a cached one reuse its result, renamed to their own variables.
+"""
+
+from collections import OrderedDict, namedtuple
+import typing
+
+from core import (
+    Cycle,
+    Failure,
+    Mismatch,
+    Substitution,
+    Term,
+    _is_ground,
+    children_dispatch,
+    get_occurs_policy,
+    match_dispatch,
+    unify,
+    update_dispatch,
+    walk_star,
+    walk_star_all,
+)
+from variable import Var
+
+# parts of variant keys
+VARIABLE = "v"  # ("v", number of the variable)
+COMPOUND = "f"  # ("f", type, number of children), followed by the children
+CONSTANT = "k"  # ("k", type, term), for ground terms and terms matched by equality
+OTHER = "m"  # ("m", type, term), for other terms without children
+
+# stored in place of the unifier of problems whose unifier is not a plain set of bindings
+UNCACHED = "uncached"
+
+CacheInfo = namedtuple("CacheInfo", "hits misses maxsize currsize")
+
+
+def variant_key(term: Term) -> typing.Tuple[typing.Tuple, typing.List[Var]]:
+    """Return the variant key of term, along with its variables in order of first occurrence.
+    The key is hashable if all constants in term are."""
+    key = []
+    numbers = {}
+    # whether terms of a type without children are matched by equality
+    by_equality = {}
+    default_match = match_dispatch.dispatch(object)
+    stack = [term]
+    while stack:
+        t = stack.pop()
+        if isinstance(t, Var):
+            key.append((VARIABLE, numbers.setdefault(t, len(numbers))))
+            continue
+        kids = children_dispatch(t)
+        if kids is not None:
+            if _is_ground(t):
+                key.append((CONSTANT, type(t), t))
+            else:
+                key.append((COMPOUND, type(t), len(kids)))
+                stack.extend(reversed(kids))
+            continue
+        try:
+            equality = by_equality[type(t)]
+        except KeyError:
+            equality = by_equality[type(t)] = (
+                match_dispatch.dispatch(type(t)) is default_match
+            )
+        key.append((CONSTANT if equality else OTHER, type(t), t))
+    return tuple(key), list(numbers)
+
+
+class UnifyCache:
+    """Drop-in replacement for unify that caches the results of up to maxsize unification problems:
+
+        cached_unify = UnifyCache(maxsize=4096)
+        s = cached_unify(u, v, s)
+
+    Terms are resolved in s before their key is computed, so the cache is shared between substitutions. The
+    unifier found for the resolved terms is added to s with update_dispatch. Failures are cached as well. Problems
+    whose unifier is more than bindings, such as unifying a variable with a constraint, are solved by unify each time.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+
+    def __call__(self, u: Term, v: Term, s: Substitution) -> Substitution:
+        return self.unify(u, v, s)
+
+    def unify(self, u: Term, v: Term, s: Substitution) -> Substitution:
+        """Unify u and v in s, like core.unify."""
+        if s:
+            u, v = walk_star_all([u, v], s)
+        key, variables = variant_key(_Problem(u, v))
+        key = (get_occurs_policy(), key)
+        try:
+            result = self._results.get(key)
+        except TypeError:
+            # some constant is not hashable
+            self.misses += 1
+            bindings = _unifier(u, v)
+            if bindings is None:
+                return unify(u, v, s)
+            return _extend(s, bindings)
+
+        if result is None:
+            self.misses += 1
+            try:
+                bindings = _unifier(u, v)
+            except (Mismatch, Cycle) as e:
+                self._store(key, type(e))
+                raise
+            if bindings is None:
+                self._store(key, UNCACHED)
+                return unify(u, v, s)
+            # variables hidden in terms without children are part of the key themselves, so they stay as they are
+            names = dict(zip(variables, _placeholders(len(variables))))
+            numbers = {x: i for i, x in enumerate(variables)}
+            self._store(
+                key,
+                tuple(
+                    zip(
+                        [numbers.get(x, x) for x in bindings],
+                        walk_star_all(bindings.values(), names),
+                    )
+                ),
+            )
+            return _extend(s, bindings)
+
+        self._results.move_to_end(key)
+        if result is UNCACHED:
+            self.misses += 1
+            return unify(u, v, s)
+        self.hits += 1
+        if isinstance(result, type):
+            raise result(u, v, s)
+        names = dict(zip(_placeholders(len(variables)), variables))
+        terms = walk_star_all([t for _, t in result], names)
+        bindings = {
+            variables[x] if type(x) is int else x: t for (x, _), t in zip(result, terms)
+        }
+        return _extend(s, bindings)
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._results))
+
+    def cache_clear(self):
+        self._results.clear()
+        self.hits = self.misses = 0
+
+    def _store(self, key, result):
+        self._results[key] = result
+        if len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+
+
+class _Problem:
+    """Pair of terms whose variables are numbered together by variant_key."""
+
+    __slots__ = ("u", "v")
+
+    def __init__(self, u: Term, v: Term):
+        self.u = u
+        self.v = v
+
+
+children_dispatch.register(_Problem, lambda p: (p.u, p.v))
+
+
+def _unifier(u: Term, v: Term) -> typing.Optional[typing.Dict[Var, Term]]:
+    """Return the most general unifier of the resolved terms u and v, in idempotent form, or None if it is not a
+    plain dict, for example if it attaches constraints to variables."""
+    mgu = unify(u, v, {})
+    if type(mgu) is not dict:
+        return None
+    return {x: walk_star(x, mgu) for x in mgu}
+
+
+def _extend(s: Substitution, bindings: typing.Dict[Var, Term]) -> Substitution:
+    result = update_dispatch(s, bindings)
+    if type(result) is Failure:
+        raise result.exception()
+    return result
+
+
+# variables that stand for the variables of a problem in cached unifiers
+_placeholder_variables = []
+
+
+def _placeholders(n: int) -> typing.List[Var]:
+    while len(_placeholder_variables) < n:
+        _placeholder_variables.append(Var())
+    return _placeholder_variables[:n]